@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tarfile
+import threading
+from typing import Dict, Hashable, Callable, Any, Tuple
+
+import numpy as np
+from natasha import NewsNERTagger
+from natasha.data import NEWS_EMBEDDING
+from navec import Navec
+from navec.meta import Meta
+from navec.pq import PQ
+from navec.vocab import Vocab
+from slovnet import Morph, Syntax
+
+NAVEC_PATH = 'models/navec_news_v1_1B_250K_300d_100q.tar'
+MORPH_PATH = 'models/slovnet_morph_news_v1.tar'
+SYNTAX_PATH = 'models/slovnet_syntax_news_v1.tar'
+
+
+class ModelRegistry:
+    """
+    Процессный реестр моделей: каждый артефакт Navec/slovnet загружается один раз,
+    и все процессоры и препроцессоры процесса получают один и тот же объект.
+    """
+    _models: Dict[Hashable, Any] = {}
+    _lock = threading.RLock()
+    # (путь, размер, mtime_ns) -> sha1 содержимого файла модели
+    _file_hashes: Dict[Tuple[str, int, int], str] = {}
+
+    @classmethod
+    def navec(cls, path: str = NAVEC_PATH) -> Navec:
+        return cls._get(('navec', path), lambda: cls._load_navec(path))
+
+    @classmethod
+    def morph(cls, path: str = MORPH_PATH, navec_path: str = NAVEC_PATH, batch_size: int = 64) -> Morph:
+        return cls._get(
+            ('morph', path, navec_path, batch_size),
+            lambda: Morph.load(path, batch_size).navec(cls.navec(navec_path))
+        )
+
+    @classmethod
+    def syntax(cls, path: str = SYNTAX_PATH, navec_path: str = NAVEC_PATH, batch_size: int = 64) -> Syntax:
+        return cls._get(
+            ('syntax', path, navec_path, batch_size),
+            lambda: Syntax.load(path, batch_size).navec(cls.navec(navec_path))
+        )
+
+    @classmethod
+    def ner(cls, navec_path: str = NEWS_EMBEDDING) -> NewsNERTagger:
+        # эмбеддинги NER по умолчанию — поставляемые с natasha, путь не зависит от рабочей директории
+        return cls._get(('ner', navec_path), lambda: NewsNERTagger(cls.navec(navec_path)))
+
+    @classmethod
+    def preload(cls):
+        """
+        Загружает модели разметки заранее. Вызывается в родительском процессе до создания пула,
+        чтобы воркеры получили уже загруженные модели через fork.
+        """
+        cls.morph()
+        cls.syntax()
+        cls.ner()
+
+    @classmethod
+    def markup_version(cls, morph_path: str = MORPH_PATH, syntax_path: str = SYNTAX_PATH,
+                       navec_path: str = NAVEC_PATH) -> str:
+        """
+        Версия моделей разметки для ключей кэша: хэш содержимого файлов моделей, так что
+        меняется при замене любого из них, даже на файл того же размера.
+        """
+        parts = [cls._file_hash(path) for path in (morph_path, syntax_path, navec_path)]
+        return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _file_hash(cls, path: str) -> str:
+        # содержимое хэшируется один раз на процесс, пока у файла не изменились размер и mtime
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        with cls._lock:
+            digest = cls._file_hashes.get(key)
+            if digest is None:
+                sha1 = hashlib.sha1()
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        sha1.update(chunk)
+                digest = cls._file_hashes[key] = sha1.hexdigest()
+        return digest
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._models.clear()
+
+    @classmethod
+    def _get(cls, key: Hashable, loader: Callable[[], Any]) -> Any:
+        model = cls._models.get(key)
+        if model is not None:
+            return model
+        with cls._lock:
+            model = cls._models.get(key)
+            if model is None:
+                model = loader()
+                cls._models[key] = model
+            return model
+
+    @staticmethod
+    def _load_navec(path: str) -> Navec:
+        """
+        Загружает Navec, отображая таблицу PQ-индексов и кодов в память только для чтения:
+        pq.bin лежит в tar без сжатия, поэтому его можно читать прямо из файла архива.
+        """
+        with tarfile.open(path, 'r') as tar:
+            meta = Meta.from_file(tar.extractfile('meta.json'))
+            Meta.check_protocol(meta.protocol)
+            vocab = Vocab.from_file(tar.extractfile('vocab.bin'))
+
+            member = tar.getmember('pq.bin')
+            header = tar.extractfile(member).read(4 * 4)
+            vectors, dim, qdim, centroids = (int(_) for _ in np.frombuffer(header, np.uint32))
+            offset = member.offset_data + len(header)
+
+        indexes = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(vectors, qdim))
+        offset += vectors * qdim
+        codes_size = (member.size - len(header) - vectors * qdim) // np.dtype(np.float32).itemsize
+        codes = np.memmap(path, dtype=np.float32, mode='r', offset=offset, shape=(codes_size,))
+        codes = codes.reshape(qdim, centroids, -1)
+
+        return Navec(meta, vocab, PQ(vectors, dim, qdim, centroids, indexes, codes))
@@ -1,10 +1,11 @@
-from typing import List, Tuple
+from typing import List, Tuple, Union
 
 from preprocess.modules.cleanup.processors.regex import RegexCleanupProcessor
+from preprocess.modules.cleanup.program import CleanupProgram
 
 
 class CleanupPipeline:
-    def __init__(self, regexes: List[Tuple[str, str]]):
+    def __init__(self, regexes: Union[List[Tuple[str, str]], CleanupProgram]):
         self.regex = RegexCleanupProcessor(regexes)
 
     def cleanup(self, text: str) -> str:
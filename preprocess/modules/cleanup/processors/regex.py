@@ -1,14 +1,17 @@
-import re
-from typing import Tuple, List
+from typing import Tuple, List, Optional, Union
+
+from preprocess.modules.cleanup.program import CleanupProgram
 
 
 class RegexCleanupProcessor:
-    def __init__(self, regexes=None):
-        if regexes is None:
-            regexes = []
-        self._cleanup_regexes: List[Tuple[str, str]] = regexes
+    def __init__(self, regexes: Optional[Union[List[Tuple[str, str]], CleanupProgram]] = None):
+        """
+        :param regexes: Правила (регулярное выражение, замена) или уже собранная программа очистки.
+        """
+        if isinstance(regexes, CleanupProgram):
+            self._program = regexes
+        else:
+            self._program = CleanupProgram(regexes or [])
 
     def cleanup(self, text: str) -> str:
-        for pattern, replacement in self._cleanup_regexes:
-            text = re.sub(pattern, replacement, text)
-        return text
+        return self._program.run(text)
@@ -0,0 +1,49 @@
+from typing import Dict, List, Sequence, Tuple
+
+import regex
+
+Rule = Tuple[str, str]
+
+# пары соседних правил, которые один проход заменяет без изменения результата
+_FUSIONS: Dict[Tuple[Rule, Rule], Rule] = {
+    # «,␣,» → «,», затем пробелы вокруг запятой → «, »: вторая запятая пары поглощается сразу
+    ((r',\s*,', ','), (r'\s*,\s*', ', ')): (r'\s*,(?:\s*,)?\s*', ', '),
+}
+
+
+class CleanupProgram:
+    """
+    Правила очистки (регулярное выражение, замена), скомпилированные движком regex один раз.
+    Соседние правила из таблицы известных безопасных слияний выполняются одним проходом.
+    """
+
+    def __init__(self, rules: Sequence[Rule]):
+        """
+        :param rules: Правила в порядке применения.
+        """
+        self.rules: Tuple[Rule, ...] = tuple((pattern, replacement) for pattern, replacement in rules)
+        self._steps = [
+            (regex.compile(pattern), replacement) for pattern, replacement in self._fuse(self.rules)
+        ]
+
+    @staticmethod
+    def _fuse(rules: Sequence[Rule]) -> List[Rule]:
+        fused: List[Rule] = []
+        i = 0
+        while i < len(rules):
+            pair = tuple(rules[i:i + 2])
+            if pair in _FUSIONS:
+                fused.append(_FUSIONS[pair])
+                i += 2
+            else:
+                fused.append(rules[i])
+                i += 1
+        return fused
+
+    def run(self, text: str) -> str:
+        for pattern, replacement in self._steps:
+            text = pattern.sub(replacement, text)
+        return text
+
+    def __len__(self) -> int:
+        return len(self._steps)
@@ -1,36 +1,137 @@
-from typing import List, Optional, Tuple
+import copy
+import re
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, Hashable, List, Optional, Tuple
 
-from hors import process_phrase
+from hors.dict import Keywords, Morph
+from hors.hors_sugar import preprocess, preprocess_today
+from hors.hors_text_parser import RX_SPLIT, parse
 from hors.models.parser_models import DateTimeToken
 from hors.partial_date.partial_datetime import PartialDateTime
+from hors.utils.parser_extractors import ParserExtractors
 
 from preprocess.modules.extraction.date.extractors.regex import RegexDateExtractor
 from preprocess.modules.markup.models import EventMarkupBlock
 
+# символы шаблона hors, ни один распознаватель которых не срабатывает без других символов
+_INERT_PATTERNS = frozenset('_NftousxyiblQH')
+
 
 class HorsDateExtractor:
+    """
+    Извлечение дат через hors по предложениям. Предложения без слов, на которые реагируют
+    распознаватели hors, пропускаются без разбора; результаты разбора кэшируются по тексту
+    предложения и опорной дате; кэш общий для потоков и защищён блокировкой.
+    """
+    _triggers: Optional[FrozenSet[str]] = None
+
+    def __init__(self, cache_size: int = 4096):
+        """
+        :param cache_size: Число предложений в LRU-кэше результатов hors.
+        """
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[Tuple[str, bool, Hashable], Tuple[str, List[DateTimeToken]]]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+
     def extract(
             self,
             text: str,
             block: EventMarkupBlock,
             now: Optional[PartialDateTime] = None,
-            token_counter: int = 1
+            token_counter: int = 1,
+            sentences: Optional[List[str]] = None
     ) -> Tuple[EventMarkupBlock, List[DateTimeToken]]:
-        result = process_phrase(text, now)
-        orig = result.source_text or text
-        if not result.dates:
+        """
+        :param text: Текст блока.
+        :param block: Блок разметки.
+        :param now: Опорная дата.
+        :param token_counter: Номер первого плейсхолдера.
+        :param sentences: Предложения, из которых через пробел собран text; без них text разбирается целиком.
+        """
+        sentences = sentences if sentences is not None else [text]
+        # как в hors.process_phrase: подстановка «сегодня» только если в тексте нет ни одной даты
+        parsed = [self._parse(sentence, now, False) for sentence in sentences]
+        if not any(dates for _, dates in parsed):
+            parsed = [self._parse(sentence, now, True) for sentence in sentences]
+        if not any(dates for _, dates in parsed):
             return block, []
 
-        dates = sorted(result.dates, key=lambda d: d.start)
-        idx = 0
-        new_text = ""
-        for d in dates:
-            frag = orig[d.start:d.end]
-            placeholder = f"<|DATETIME_{token_counter}|>"
-            new_text += orig[idx:d.start]
-            RegexDateExtractor.replace_in_block(frag, placeholder, block)
-            new_text += placeholder
-            token_counter += 1
-            idx = d.end
-        new_text += orig[idx:]
+        dates: List[DateTimeToken] = []
+        replacements: List[Tuple[str, str]] = []
+        offset = 0
+        for source, sentence_dates in parsed:
+            for d in sorted(sentence_dates, key=lambda d: d.start):
+                replacements.append((source[d.start:d.end], f"<|DATETIME_{token_counter}|>"))
+                token_counter += 1
+                # смещения переводятся из предложения в текст блока
+                shifted = copy.copy(d)
+                shifted.start, shifted.end = d.start + offset, d.end + offset
+                dates.append(shifted)
+            offset += len(source) + 1
+        RegexDateExtractor.replace_many_in_block(replacements, block)
         return block, dates
+
+    def _parse(self, sentence: str, now: Optional[PartialDateTime], today: bool) \
+            -> Tuple[str, List[DateTimeToken]]:
+        """
+        Разбирает предложение hors с той же предобработкой, что и hors.process_phrase.
+        :param today: Применять ли подстановку «сегодня» к «утром»/«днём»/«вечером».
+        :return: Предобработанный текст предложения и даты в его координатах.
+        """
+        phrase = preprocess(sentence)
+        if today:
+            phrase = preprocess_today(phrase)
+        if not self._has_trigger(phrase):
+            return phrase, []
+
+        key = (phrase, today, self._now_key(now))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        # разбор вне блокировки: при гонке два потока разберут одно предложение, результат одинаков
+        result = parse(phrase, now or PartialDateTime())
+        cached = (result.source_text or phrase, list(result.dates))
+        with self._cache_lock:
+            self._cache[key] = cached
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return cached
+
+    @classmethod
+    def _has_trigger(cls, phrase: str) -> bool:
+        triggers = cls._get_triggers()
+        for token in RX_SPLIT.split(phrase.lower()):
+            t = re.sub(r'[^0-9а-яё-]', '', token)
+            if t in triggers or any(c.isdigit() for c in t):
+                return True
+        return False
+
+    @classmethod
+    def _get_triggers(cls) -> FrozenSet[str]:
+        """
+        Слова, которые hors превращает в значимые символы шаблона: формы из словаря hors
+        и ключевые слова, кроме предлогов, союза «и» и модификаторов без опорного слова.
+        """
+        if cls._triggers is None:
+            words = set(Morph.storage)
+            for value in vars(Keywords).values():
+                if isinstance(value, list):
+                    words.update(value)
+            triggers = {
+                re.sub(r'[^0-9а-яё-]', '', word.lower()) for word in words
+                if ParserExtractors.create_pattern_from(word) not in _INERT_PATTERNS
+            }
+            triggers.discard('')
+            cls._triggers = frozenset(triggers)
+        return cls._triggers
+
+    @staticmethod
+    def _now_key(now: Optional[PartialDateTime]) -> Hashable:
+        if now is None:
+            return None
+        return (now.year, now.month, now.day, now.hour, now.minute, now.second, now.microsecond,
+                now.relative_offset)
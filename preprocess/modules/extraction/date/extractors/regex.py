@@ -1,9 +1,11 @@
 import re
-from typing import Tuple, List, Optional
+from collections import deque
+from typing import Deque, Dict, Tuple, List, Optional
 
 from hors.models.parser_models import DateTimeToken
 from hors.partial_date.partial_datetime import PartialDateTime
 
+from preprocess.modules.markup.matching import PhraseTrie
 from preprocess.modules.markup.models import EventMarkupBlock
 from preprocess.modules.markup.pipeline import EventMarkup
 
@@ -19,6 +21,10 @@ class RegexDateExtractor:
             token_counter: int = 1
     ) -> Tuple[EventMarkupBlock, List[DateTimeToken]]:
         dates: List[DateTimeToken] = []
+        # совпадения, найденные в тексте блока, сразу переводятся в токены по его индексу
+        indexed = text == block.text
+        spans: Dict[int, List[Tuple[int, int, str]]] = {}
+        replacements: List[Tuple[str, str]] = []
 
         def repl(m: re.Match) -> str:
             nonlocal token_counter
@@ -31,11 +37,18 @@ class RegexDateExtractor:
                 return s
             placeholder = f"<|DATETIME_{token_counter}|>"
             token_counter += 1
-            # патчим только разметку внутри блока
-            self.replace_in_block(s, placeholder, block)
+            span = block.token_range(m.start(), m.end()) if indexed else None
+            if span is not None and block[span[0]].columns.texts[span[1]:span[1] + span[2]] == s.split():
+                m_idx, start, length = span
+                spans.setdefault(m_idx, []).append((start, length, placeholder))
+            else:
+                replacements.append((s, placeholder))
             return placeholder
 
         re.sub(self.regex, repl, text)
+        # патчим только разметку внутри блока, все даты за один проход
+        self._collapse_spans(block, spans)
+        self.replace_many_in_block(replacements, block)
         return block, dates
 
     @staticmethod
@@ -44,25 +57,94 @@ class RegexDateExtractor:
             placeholder: str,
             block: EventMarkupBlock
     ):
-        words = date_str.split()
-        for em in block:
-            tokens = em.tokens
-            for i in range(len(tokens) - len(words) + 1):
-                if all(tokens[i + j].text == words[j] for j in range(len(words))):
-                    # вырезаем matched, переносим детей, меняем parent.text
-                    matched = tokens[i:i + len(words)]
-                    ids = {t.id for t in matched}
-                    parent = next(t for t in matched if t.head_id not in ids)
-                    for t in matched:
-                        if t is parent: continue
-                        for child in tokens:
-                            if child.head_id == t.id:
-                                child.head_id = parent.id
-                        tokens.remove(t)
-                    parent.text = placeholder
-                    # пересчёт id/head_id
-                    RegexDateExtractor.renumber(em)
-                    return
+        RegexDateExtractor.replace_many_in_block([(date_str, placeholder)], block)
+
+    @staticmethod
+    def replace_many_in_block(
+            replacements: List[Tuple[str, str]],
+            block: EventMarkupBlock
+    ):
+        """
+        Сворачивает фрагменты дат в токены-плейсхолдеры пакетом: вхождения всех фрагментов
+        собираются за один проход по блоку, затем каждое предложение пересобирается один раз.
+        Каждый фрагмент по порядку занимает первое вхождение, не пересекающееся с уже занятыми.
+        :param replacements: Пары (фрагмент текста, плейсхолдер).
+        :param block: Блок разметки, изменяется на месте.
+        """
+        phrases = PhraseTrie()
+        for date_str, _ in replacements:
+            words = tuple(date_str.split())
+            if words:
+                phrases.add(words, words)
+        if not phrases:
+            return
+
+        # фраза -> вхождения (номер предложения, позиция первого токена) в порядке блока
+        occurrences: Dict[Tuple[str, ...], Deque[Tuple[int, int]]] = {}
+        for m_idx, em in enumerate(block):
+            texts = em.columns.texts
+            for i in range(len(texts)):
+                for _, words in phrases.prefixes(texts, i):
+                    occurrences.setdefault(words, deque()).append((m_idx, i))
+
+        taken: Dict[int, bytearray] = {}
+        spans: Dict[int, List[Tuple[int, int, str]]] = {}
+        for date_str, placeholder in replacements:
+            words = tuple(date_str.split())
+            queue = occurrences.get(words)
+            while queue:
+                m_idx, start = queue.popleft()
+                mask = taken.get(m_idx)
+                if mask is None:
+                    mask = taken[m_idx] = bytearray(len(block[m_idx].columns))
+                if any(mask[start:start + len(words)]):
+                    # занятые токены уже не освободятся, вхождение отбрасывается
+                    continue
+                mask[start:start + len(words)] = b'\x01' * len(words)
+                spans.setdefault(m_idx, []).append((start, len(words), placeholder))
+                break
+
+        RegexDateExtractor._collapse_spans(block, spans)
+
+    @staticmethod
+    def _collapse_spans(block: EventMarkupBlock, spans: Dict[int, List[Tuple[int, int, str]]]):
+        for m_idx, em_spans in spans.items():
+            em_spans.sort()
+            RegexDateExtractor._collapse(block[m_idx], em_spans)
+
+    @staticmethod
+    def _collapse(em: EventMarkup, spans: List[Tuple[int, int, str]]):
+        """
+        Заменяет каждый отрезок токенов одним токеном: его вершиной (токеном, чья голова
+        вне отрезка) с текстом плейсхолдера. Дети удалённых токенов переходят к вершине,
+        id и head_id пересчитываются один раз.
+        :param em: Разметка предложения.
+        :param spans: Непересекающиеся отрезки (начало, длина, плейсхолдер) по возрастанию.
+        """
+        tokens = em.tokens
+        # id удалённого токена -> id вершины его отрезка
+        redirect: Dict[int, int] = {}
+        kept = []
+        position = 0
+        for start, length, placeholder in spans:
+            kept.extend(tokens[position:start])
+            matched = tokens[start:start + length]
+            ids = {t.id for t in matched}
+            parent = next(t for t in matched if t.head_id not in ids)
+            for t in matched:
+                if t is not parent:
+                    redirect[t.id] = parent.id
+            parent.text = placeholder
+            kept.append(parent)
+            position = start + length
+        kept.extend(tokens[position:])
+
+        old2new = {t.id: new_id for new_id, t in enumerate(kept, start=1)}
+        for t in kept:
+            head_id = redirect.get(t.head_id, t.head_id)
+            t.id = old2new[t.id]
+            t.head_id = old2new.get(head_id, 0)
+        em.tokens = kept
 
     @staticmethod
     def renumber(em):
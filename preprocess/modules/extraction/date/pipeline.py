@@ -15,12 +15,14 @@ class DateExtractionPipeline:
 
     def process(self, block: EventMarkupBlock, now: Optional[PartialDateTime] = None) \
             -> Tuple[EventMarkupBlock, List[DateTimeToken]]:
-        text = str(block)
+        # текст и предложения снимаются до замены дат регэкспом; оба берутся из кэша блока
+        text = block.text
+        sentences = [str(em) for em in block]
 
         dates: List[DateTimeToken] = []
         block, dates_res = self.regex_extractor.extract(text, block)
         dates.extend(dates_res)
-        block, dates_res = self.hors_extractor.extract(text, block, now)
+        block, dates_res = self.hors_extractor.extract(text, block, now, sentences=sentences)
         dates.extend(dates_res)
 
         return block, dates
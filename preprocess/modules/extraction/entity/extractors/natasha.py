@@ -1,40 +1,84 @@
 from typing import Tuple, List, Dict
 
-from natasha import Segmenter, MorphVocab, NewsEmbedding, NewsNERTagger, Doc
+from razdel.substring import Substring
+from slovnet.bio import bio_spans
+from slovnet.span import Span
 
-from story_elements.models import StoryElement, StoryElementExtractionOrigin
+from preprocess.models.registry import ModelRegistry
+from preprocess.modules.extraction.rewriter import SpanRewriter
+from preprocess.modules.markup.segmentation import Segmentation
+from story_elements.models import StoryElementRecord, StoryElementExtractionOrigin
 
 
 class NatashaEntityExtractor:
     def __init__(self):
-        self.segmenter = Segmenter()
-        self.morph_vocab = MorphVocab()
-        self.emb = NewsEmbedding()
-        self.ner_tagger = NewsNERTagger(self.emb)
+        self.ner_tagger = ModelRegistry.ner()
 
-    def extract(self, text: str, token_counters: Dict[str, int] = None) -> Tuple[str, Dict[str, List[StoryElement]]]:
+    def extract(
+            self,
+            segmentation: Segmentation,
+            token_counters: Dict[str, int] = None
+    ) -> Tuple[str, Dict[str, List[StoryElementRecord]]]:
         if token_counters is None:
             token_counters = {}
-        doc = Doc(text)
-        doc.segment(self.segmenter)
-        doc.tag_ner(self.ner_tagger)
-        for span in doc.spans:
-            span.normalize(self.morph_vocab)
+        return self.extract_many([segmentation], [token_counters])[0]
+
+    def extract_many(
+            self,
+            segmentations: List[Segmentation],
+            token_counters: List[Dict[str, int]]
+    ) -> List[Tuple[str, Dict[str, List[StoryElementRecord]]]]:
+        """
+        Пакетный вариант extract: NER по всем абзацам выполняется одним проходом модели.
+        :param segmentations: Сегментации абзацев.
+        :param token_counters: Счётчики спецтокенов каждого абзаца.
+        :return: Текст с заменёнными сущностями и найденные сущности для каждого абзаца.
+        """
+        spans_list = self._tag_many([segmentation.tokens for segmentation in segmentations])
+        return [
+            self._replace_spans(segmentation.text, spans, counters)
+            for segmentation, spans, counters in zip(segmentations, spans_list, token_counters)
+        ]
+
+    def _replace_spans(
+            self,
+            text: str,
+            spans: List[Span],
+            token_counters: Dict[str, int]
+    ) -> Tuple[str, Dict[str, List[StoryElementRecord]]]:
         entities = {}
-        spans_sorted = sorted(doc.spans, key=lambda s: s.start, reverse=True)
+        rewriter = SpanRewriter(text)
+        # нумерация спецтокенов идёт с конца абзаца, как при прежней замене справа налево
+        spans_sorted = sorted(spans, key=lambda s: s.start, reverse=True)
         for span in spans_sorted:
             etype = span.type
             if etype not in token_counters:
                 token_counters[etype] = 1
             token = f"<|{etype}_{token_counters[etype]}|>"
             token_counters[etype] += 1
-            element = StoryElement(
-                name=span.text,
+            element = StoryElementRecord(
+                name=text[span.start:span.stop],
                 type=etype,
                 extraction_origin=StoryElementExtractionOrigin.NATASHA
             )
             if etype not in entities:
                 entities[etype] = []
             entities[etype].append(element)
-            text = text[:span.start] + token + text[span.stop:]
+            rewriter.replace(span.start, span.stop, token)
+        text, _ = rewriter.apply()
         return text, entities
+
+    def _tag_many(self, tokens_list: List[List[Substring]]) -> List[List[Span]]:
+        # NER по готовым токенам сегментации, без повторной токенизации текста;
+        # абзацы упорядочиваются по длине, чтобы батчи кодировщика меньше дополнялись паддингом
+        result: List[List[Span]] = [[] for _ in tokens_list]
+        order = sorted((i for i, tokens in enumerate(tokens_list) if tokens),
+                       key=lambda i: len(tokens_list[i]))
+        if not order:
+            return result
+        infer = self.ner_tagger.infer
+        items = [[token.text for token in tokens_list[i]] for i in order]
+        preds = infer.decoder(infer.process(infer.encoder(items)))
+        for i, tags in zip(order, preds):
+            result[i] = list(bio_spans(tokens_list[i], tags))
+        return result
@@ -1,10 +1,11 @@
 import re
+from bisect import bisect_right
 from typing import Dict, List, Tuple
 
-from razdel import tokenize
-
+from preprocess.modules.extraction.rewriter import OffsetMap
 from preprocess.modules.markup.models import EventMarkup, EventToken
-from story_elements.models import StoryElement, StoryElementExtractionOrigin
+from preprocess.modules.markup.segmentation import Segmentation
+from story_elements.models import StoryElementRecord, StoryElementExtractionOrigin
 
 
 class RegexEntityExtractor:
@@ -15,23 +16,33 @@ class RegexEntityExtractor:
 
     def extract(
             self,
-            text: str,
+            segmentation: Segmentation,
             event_markups: List[EventMarkup],
             token_counters: Dict[str, int] = None
-    ) -> Tuple[str, Dict[str, List[StoryElement]]]:
+    ) -> Tuple[Segmentation, Dict[str, List[StoryElementRecord]]]:
         if token_counters is None:
             token_counters = {}
         for etype in self.regexes.keys():
             token_counters.setdefault(etype, 1)
 
-        entities: Dict[str, List[StoryElement]] = {}
-        original_text = text
+        entities: Dict[str, List[StoryElementRecord]] = {}
 
         flat_tokens: List[EventToken] = []
         for markup in event_markups:
             flat_tokens.extend(markup.tokens)
 
-        global_tokens = list(tokenize(original_text))
+        # токены исходной сегментации взаимно однозначно соответствуют flat_tokens;
+        # индекс по смещениям строится один раз, совпадения следующих шаблонов
+        # переводятся в исходные координаты через offset_maps
+        global_tokens = segmentation.tokens
+        token_starts = [token.start for token in global_tokens]
+        token_stops = [token.stop for token in global_tokens]
+        offset_maps: List[OffsetMap] = []
+
+        def to_original(pos: int) -> int:
+            for offsets in reversed(offset_maps):
+                pos = offsets.to_old(pos)
+            return pos
 
         allowed_punct = {',', '-', '—'}
 
@@ -43,18 +54,20 @@ class RegexEntityExtractor:
             return ev_token.pos == 'PROPN'
 
         def repl(match: re.Match, etype: str) -> str:
-            match_start, match_end = match.span()
+            match_start, match_end = to_original(match.start()), to_original(match.end())
             filtered = []
             entity_case = None
 
-            for i, token in enumerate(global_tokens):
-                if token.start < match_end and token.stop > match_start:
-                    if i < len(flat_tokens):
-                        ev = flat_tokens[i]
-                        if is_desired_token(ev):
-                            filtered.append(token.text)
-                            if entity_case is None and ev.pos == 'PROPN':
-                                entity_case = ev.feats.get('Case', 'Nom')
+            # первый токен, заканчивающийся после начала совпадения; дальше — пока токены начинаются до его конца
+            i = bisect_right(token_stops, match_start)
+            while i < len(global_tokens) and token_starts[i] < match_end:
+                if i < len(flat_tokens):
+                    ev = flat_tokens[i]
+                    if is_desired_token(ev):
+                        filtered.append(global_tokens[i].text)
+                        if entity_case is None and ev.pos == 'PROPN':
+                            entity_case = ev.feats.get('Case', 'Nom')
+                i += 1
 
             while filtered and filtered[0] in allowed_punct:
                 filtered.pop(0)
@@ -68,7 +81,7 @@ class RegexEntityExtractor:
             # Убрано добавление токенов падежа
             placeholder = f"<|{etype}_{token_counters[etype]}|>"
 
-            elem = StoryElement(
+            elem = StoryElementRecord(
                 name=filtered_entity,
                 type=etype,
                 extraction_origin=StoryElementExtractionOrigin.REGEX
@@ -79,6 +92,13 @@ class RegexEntityExtractor:
             return placeholder
 
         for itype, pattern in self.regexes.items():
-            text = re.sub(pattern, lambda m, etype=itype: repl(m, etype), text)
-
-        return text, entities
+            edits = []
+            for match in re.finditer(pattern, segmentation.text):
+                replacement = repl(match, itype)
+                if replacement != match.group(0):
+                    edits.append((match.start(), match.end(), replacement))
+            if edits:
+                offset_maps.append(OffsetMap(edits))
+            segmentation = segmentation.replace(edits)
+
+        return segmentation, entities
@@ -1,50 +1,118 @@
 import re
 import uuid
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 
 from slovnet.markup import MorphToken, SyntaxToken
 
 from preprocess.modules.extraction.entity.extractors.natasha import NatashaEntityExtractor
 from preprocess.modules.extraction.entity.extractors.regex import RegexEntityExtractor
+from preprocess.modules.markup.matching import PhraseTrie
 from preprocess.modules.markup.models import EventMarkup, EventToken, EventMarkupBlock
-from story_elements.models import StoryElement
+from preprocess.modules.markup.segmentation import Segmentation
+from story_elements.database import StoryElementsDatabase
+from story_elements.models import StoryElementRecord
 
 
 class EntityExtractionPipeline:
-    def __init__(self, elems_database, regexes: Dict[str, str]):
+    def __init__(self, elems_database: StoryElementsDatabase, regexes: Dict[str, str]):
         self.natasha_extractor = NatashaEntityExtractor()
         self.regex_extractor = RegexEntityExtractor(regexes)
         self.elems_database = elems_database
 
     def process(
             self,
-            block: EventMarkupBlock
+            block: EventMarkupBlock,
+            database: Optional[StoryElementsDatabase] = None
     ) -> Tuple[EventMarkupBlock, Dict[str, Dict[int, uuid.UUID]]]:
-        # 1. собрали текст
-        text = str(block)
-        markups = block.markups
-        token_counters: Dict[str, int] = {}
-        entities_dict: Dict[str, List[StoryElement]] = {}
+        return self.process_many([block], database)[0]
 
-        # 2. regex-экстрактор
-        text, res = self.regex_extractor.extract(text, markups, token_counters)
-        for k, lst in res.items():
-            entities_dict.setdefault(k, []).extend(lst)
+    def process_many(
+            self,
+            blocks: List[EventMarkupBlock],
+            database: Optional[StoryElementsDatabase] = None
+    ) -> List[Tuple[EventMarkupBlock, Dict[str, Dict[int, uuid.UUID]]]]:
+        """
+        Пакетный вариант process: извлечение по всем блокам (extract_many), после чего сущности
+        добавляются в базу по блокам в исходном порядке.
+        :param blocks: Блоки разметки абзацев.
+        :param database: База элементов документа; по умолчанию — база пайплайна.
+        :return: Блоки и элементы событий в порядке блоков.
+        """
+        return [
+            self.add_entities(block, extracted, database)
+            for block, extracted in zip(blocks, self.extract_many(blocks))
+        ]
+
+    def extract_many(
+            self,
+            blocks: List[EventMarkupBlock]
+    ) -> List[Tuple[str, Dict[str, List[StoryElementRecord]]]]:
+        """
+        Извлекает сущности без обращения к базе: regex-экстрактор отрабатывает по всем блокам,
+        затем Natasha размечает все блоки одним проходом NER.
+        :param blocks: Блоки разметки абзацев.
+        :return: Для каждого блока — текст с временными спецтокенами и найденные сущности по типам.
+        """
+        segmentations: List[Segmentation] = []
+        counters: List[Dict[str, int]] = []
+        entities: List[Dict[str, List[StoryElementRecord]]] = []
+        for block in blocks:
+            # 1. собрали текст и его сегментацию из разметки
+            segmentation = Segmentation.from_markups(block.markups)
+            token_counters: Dict[str, int] = {}
+            entities_dict: Dict[str, List[StoryElementRecord]] = {}
+
+            # 2. regex-экстрактор
+            segmentation, res = self.regex_extractor.extract(segmentation, block.markups, token_counters)
+            for k, lst in res.items():
+                entities_dict.setdefault(k, []).extend(lst)
+
+            segmentations.append(segmentation)
+            counters.append(token_counters)
+            entities.append(entities_dict)
 
         # 3. Natasha
-        text, res = self.natasha_extractor.extract(text, token_counters)
-        for k, lst in res.items():
-            entities_dict.setdefault(k, []).extend(lst)
+        natasha_results = self.natasha_extractor.extract_many(segmentations, counters)
+
+        extracted = []
+        for entities_dict, (text, res) in zip(entities, natasha_results):
+            for k, lst in res.items():
+                entities_dict.setdefault(k, []).extend(lst)
+            extracted.append((text, entities_dict))
+        return extracted
 
+    def add_entities(
+            self,
+            block: EventMarkupBlock,
+            extracted: Tuple[str, Dict[str, List[StoryElementRecord]]],
+            database: Optional[StoryElementsDatabase] = None
+    ) -> Tuple[EventMarkupBlock, Dict[str, Dict[int, uuid.UUID]]]:
+        """
+        Добавляет сущности блока, найденные extract_many, в базу и заменяет их в разметке спецтокенами.
+        :param block: Блок разметки абзаца.
+        :param extracted: Результат extract_many для этого блока.
+        :param database: База элементов документа; по умолчанию — база пайплайна.
+        :return: Блок и элементы события.
+        """
+        text, entities_dict = extracted
+        return self._process_entities(block, text, entities_dict, database or self.elems_database)
+
+    def _process_entities(
+            self,
+            block: EventMarkupBlock,
+            text: str,
+            entities_dict: Dict[str, List[StoryElementRecord]],
+            database: StoryElementsDatabase
+    ) -> Tuple[EventMarkupBlock, Dict[str, Dict[int, uuid.UUID]]]:
         # 4. сбор и замена в тексте
         combined = self._build_combined_tokens(entities_dict)
         text = self._apply_entity_replacement(text, combined)
-        mapping, global_ids = self._build_combined_mapping(combined)
+        mapping, global_ids = self._build_combined_mapping(combined, database)
         text = self._update_tokens(text, mapping)
         text = self._merge_adjacent_tokens(text)
 
         # 5. обновляем разметку внутри блока
-        self._update_markups(text, markups, combined, mapping)
+        self._update_markups(text, block.markups, combined, mapping)
 
         # 6. собираем элементы и отдаем
         final_map = self._build_final_index_mapping(global_ids)
@@ -52,8 +120,8 @@ class EntityExtractionPipeline:
 
         return block, event_elements
 
-    def _build_combined_tokens(self, entities_dict: Dict[str, List[StoryElement]]
-                               ) -> Dict[str, Dict[int, StoryElement]]:
+    def _build_combined_tokens(self, entities_dict: Dict[str, List[StoryElementRecord]]
+                               ) -> Dict[str, Dict[int, StoryElementRecord]]:
         combined_tokens = {'PER': {}, 'LOC': {}, 'ORG': {}}
         for t_type in combined_tokens:
             for idx, elem in enumerate(entities_dict.get(t_type, []), 1):
@@ -61,19 +129,20 @@ class EntityExtractionPipeline:
         return combined_tokens
 
     def _apply_entity_replacement(self, text: str,
-                                  combined_tokens: Dict[str, Dict[int, StoryElement]]) -> str:
+                                  combined_tokens: Dict[str, Dict[int, StoryElementRecord]]) -> str:
+
+        # часть имени -> спецтокен; при совпадении частей побеждает первый по порядку типов и индексов
+        part_to_token: Dict[str, str] = {}
+        for t_type, tokens in combined_tokens.items():
+            for idx, elem in tokens.items():
+                for part in elem.name.split():
+                    part_to_token.setdefault(part, f"<|{t_type}_{idx}|>")
 
         def replace_word(match: re.Match) -> str:
             word = match.group(0)
             if not word[0].isupper() or len(word) <= 2:
                 return word
-
-            for t_type, tokens in combined_tokens.items():
-                for idx, elem in tokens.items():
-                    if word in elem.name.split():
-                        return f"<|{t_type}_{idx}|>"
-
-            return word
+            return part_to_token.get(word, word)
 
         return re.sub(r'(?<!<\|)\b\w+\b(?!\|>)', replace_word, text)
 
@@ -90,12 +159,13 @@ class EntityExtractionPipeline:
                       lambda m: re.findall(r'<\|\w+_\d+\|>', m.group(0))[0],
                       text)
 
-    def _build_combined_mapping(self, combined_tokens: Dict[str, Dict[int, StoryElement]]) -> Tuple[
+    def _build_combined_mapping(self, combined_tokens: Dict[str, Dict[int, StoryElementRecord]],
+                                database: StoryElementsDatabase) -> Tuple[
         Dict[Tuple[str, int], int], Dict[str, Dict[uuid.UUID, int]]]:
         global_ids = {'PER': {}, 'LOC': {}, 'ORG': {}}
         mapping: Dict[Tuple[str, int], int] = {}
         for t_type, temp_map in combined_tokens.items():
-            repo = self.elems_database.repositories[t_type]
+            repo = database.repositories[t_type]
             if temp_map:
                 new_idxs, id_map = repo.add_elements(temp_map)
                 for final_idx, eid in id_map.items():
@@ -131,30 +201,30 @@ class EntityExtractionPipeline:
                 final_idx = combined_mapping.get((t_type, temp_idx), temp_idx)
                 token = f"<|{t_type}_{final_idx}|>"
                 phrase_to_token[elem.name] = token
+        phrases = PhraseTrie.from_phrases(phrase_to_token)
 
         # Обрабатываем каждую маркировку
         for markup in markups:
             tokens = markup.tokens
+            texts = [t.text for t in tokens]
             new_tokens = []
             original_ids_list = []
             i = 0
             while i < len(tokens):
                 # Ищем самую длинную последовательность, которая соответствует сущности
-                for k in range(len(tokens) - i, 0, -1):
-                    phrase = ' '.join(t.text for t in tokens[i:i + k])
-                    if phrase in phrase_to_token:
-                        token = phrase_to_token[phrase]
-                        # Находим головной токен: его head_id не в последовательности
-                        seq_ids = {t.id for t in tokens[i:i + k]}
-                        head_token = next(t for t in tokens[i:i + k] if t.head_id not in seq_ids)
-                        # Создаем новый токен с текстом спецтокена и метками от головного токена
-                        new_morph = MorphToken(text=token, pos=head_token.pos, feats=head_token.feats)
-                        new_syntax = SyntaxToken(id=0, head_id=head_token.head_id, rel=head_token.rel, text=token)
-                        new_token = EventToken(new_morph, new_syntax)
-                        new_tokens.append(new_token)
-                        original_ids_list.append([t.id for t in tokens[i:i + k]])
-                        i += k
-                        break
+                match = phrases.longest_match(texts, i)
+                if match is not None:
+                    k, token = match
+                    # Находим головной токен: его head_id не в последовательности
+                    seq_ids = {t.id for t in tokens[i:i + k]}
+                    head_token = next(t for t in tokens[i:i + k] if t.head_id not in seq_ids)
+                    # Создаем новый токен с текстом спецтокена и метками от головного токена
+                    new_morph = MorphToken(text=token, pos=head_token.pos, feats=head_token.feats)
+                    new_syntax = SyntaxToken(id=0, head_id=head_token.head_id, rel=head_token.rel, text=token)
+                    new_token = EventToken(new_morph, new_syntax)
+                    new_tokens.append(new_token)
+                    original_ids_list.append([t.id for t in tokens[i:i + k]])
+                    i += k
                 else:
                     # Нет совпадения, добавляем оригинальный токен
                     new_tokens.append(tokens[i])
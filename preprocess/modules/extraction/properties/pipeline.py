@@ -1,33 +1,42 @@
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, List, Tuple, Optional, Set
 import uuid
+from collections import deque
 
-from preprocess.modules.markup.pipeline import EventMarkup, EventToken
+from preprocess.modules.markup.models import EventMarkup, EventToken
 from story_elements.database import StoryElementsDatabase
 
 
 class PropertiesExtractionPipeline:
     def __init__(self, story_elements_db: StoryElementsDatabase):
         self.db = story_elements_db
-        # регэксп для спецтокенов вида <PER_1>, <LOC_2>, <ORG_3>
-        self.token_pattern = re.compile(r'<(PER|LOC|ORG)_(\d+)>')
+        # регэксп для спецтокенов вида <|PER_1|>, <|LOC_2|>, <|ORG_3|>
+        self.token_pattern = re.compile(r'<\|(PER|LOC|ORG)_(\d+)\|>')
 
     def process(
             self,
             text: str,
             markups: List[EventMarkup],
-            elements: Dict[str, Dict[int, uuid.UUID]]
+            elements: Dict[str, Dict[int, uuid.UUID]],
+            database: Optional[StoryElementsDatabase] = None
     ) -> Tuple[str, List[EventMarkup]]:
         """
         Для каждого EventMarkup:
-        1) Ищет спецтокены <TYPE_idx>.
+        1) Ищет спецтокены <|TYPE_idx|>.
         2) Собирает детей по amod/appos/cop/xcomp/advcl/advmod/acl:relcl/obj/nsubj.
         3) Сохраняет свойства в базе и помечает токены на удаление.
-        4) Удаляет эти токены из markup и чистит текст.
+        4) Удаляет эти токены из markup и чистит текст. Корень предложения и спецтокены
+           не удаляются, дети удалённых токенов переходят к ближайшему оставшемуся предку.
+        Свойства пишутся в database, по умолчанию — в базу пайплайна.
         """
+        database = database or self.db
+        # свойства копятся по элементам и записываются в базу одним проходом в конце
+        properties: Dict[Tuple[str, uuid.UUID], List[str]] = {}
+        removed_words: Set[str] = set()
         for em in markups:
             to_remove_ids = set()
             token_map = {t.id: t for t in em.tokens}
+            children = self._children_index(em.tokens)
 
             for tok in em.tokens:
                 m = self.token_pattern.fullmatch(tok.text)
@@ -40,14 +49,14 @@ class PropertiesExtractionPipeline:
                     continue
 
                 # 1) amod / appos → прилагательные/качественные признаки
-                for child in self._children(em.tokens, tok.id, rels=('amod', 'appos')):
-                    self._add_property(ent_type, ent_uuid, child.text)
+                for child in self._children(children, tok.id, rels=('amod', 'appos')):
+                    self._add_property(properties, ent_type, ent_uuid, child.text)
                     to_remove_ids.add(child.id)
 
                 # 2) cop → xcomp/advcl → ADJ/V
-                for cop in self._children(em.tokens, tok.id, rels=('cop',)):
-                    for ch in self._children(em.tokens, cop.id, rels=('xcomp', 'advcl')):
-                        self._add_property(ent_type, ent_uuid, ch.text)
+                for cop in self._children(children, tok.id, rels=('cop',)):
+                    for ch in self._children(children, cop.id, rels=('xcomp', 'advcl')):
+                        self._add_property(properties, ent_type, ent_uuid, ch.text)
                         to_remove_ids.add(ch.id)
 
                 # 3) глаголы, где сущность nsubj или obj
@@ -55,59 +64,102 @@ class PropertiesExtractionPipeline:
                     head = token_map.get(tok.head_id)
                     if head and head.pos and head.pos.startswith('V'):
                         # сам глагол
-                        self._add_property(ent_type, ent_uuid, head.text)
+                        self._add_property(properties, ent_type, ent_uuid, head.text)
                         to_remove_ids.add(head.id)
                         # все advmod → тип действия/манеры
-                        for adv in self._children(em.tokens, head.id, rels=('advmod',)):
-                            self._add_property(ent_type, ent_uuid, adv.text)
+                        for adv in self._children(children, head.id, rels=('advmod',)):
+                            self._add_property(properties, ent_type, ent_uuid, adv.text)
                             to_remove_ids.add(adv.id)
 
                 # 4) относительные придаточные: acl:relcl
-                for relcl in self._children(em.tokens, tok.id, rels=('acl:relcl',)):
-                    subtree = self._collect_subtree(em.tokens, relcl.id)
+                for relcl in self._children(children, tok.id, rels=('acl:relcl',)):
+                    subtree = self._collect_subtree(children, relcl.id)
                     phrase = ' '.join(token_map[i].text for i in sorted(subtree))
-                    self._add_property(ent_type, ent_uuid, phrase)
+                    self._add_property(properties, ent_type, ent_uuid, phrase)
                     to_remove_ids |= subtree
 
             # удаляем токены-характеристики из markup
-            em.tokens = [t for t in em.tokens if t.id not in to_remove_ids]
-
-            # Чистим текст (удаляем вхождения свойств)
-            for tok_id in to_remove_ids:
-                text = re.sub(
-                    rf'\b{re.escape(token_map[tok_id].text)}\b',
-                    '',
-                    text
-                )
-
+            to_remove_ids = {
+                tok_id for tok_id in to_remove_ids
+                if token_map[tok_id].head_id in token_map
+                and not self.token_pattern.fullmatch(token_map[tok_id].text)
+            }
+            self._remove_tokens(em, to_remove_ids)
+            removed_words.update(token_map[tok_id].text for tok_id in to_remove_ids)
+
+        # Чистим текст (удаляем вхождения свойств) одним проходом
+        text = self._remove_words(text, removed_words)
+
+        self._write_properties(database, properties)
         return text, markups
 
-    def _add_property(self, ent_type: str, ent_uuid: uuid.UUID, prop: str):
-        repo = {
-            'PER': self.db.characters,
-            'LOC': self.db.locations,
-            'ORG': self.db.organizations
-        }[ent_type]
-        element = repo.find_by_id(ent_uuid)
-        if element:
-            element.properties.append(prop)
-            repo.add(element)  # обновляем запись
+    @staticmethod
+    def _remove_tokens(em: EventMarkup, ids: Set[int]):
+        """
+        Удаляет токены ids из разметки: дети удалённых токенов переходят к ближайшему
+        оставшемуся предку, id и head_id пересчитываются по порядку, как в RegexDateExtractor._collapse.
+        """
+        if not ids:
+            return
+        heads = {t.id: t.head_id for t in em.tokens}
+        kept = [t for t in em.tokens if t.id not in ids]
+        old2new = {t.id: new_id for new_id, t in enumerate(kept, start=1)}
+        for t in kept:
+            head_id = t.head_id
+            seen = set()
+            while head_id in ids and head_id not in seen:
+                seen.add(head_id)
+                head_id = heads[head_id]
+            t.id = old2new[t.id]
+            t.head_id = old2new.get(head_id, 0)
+        em.tokens = kept
+
+    def _remove_words(self, text: str, words: Set[str]) -> str:
+        words = {w for w in words if w}
+        if not words:
+            return text
+        # длинные слова раньше в альтернации, чтобы совпадение не обрезалось на более коротком
+        alternation = '|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+        return re.compile(rf'\b(?:{alternation})\b').sub('', text)
+
+    def _add_property(self, properties: Dict[Tuple[str, uuid.UUID], List[str]],
+                      ent_type: str, ent_uuid: uuid.UUID, prop: str):
+        properties.setdefault((ent_type, ent_uuid), []).append(prop)
+
+    def _write_properties(self, database: StoryElementsDatabase,
+                          properties: Dict[Tuple[str, uuid.UUID], List[str]]):
+        for (ent_type, ent_uuid), props in properties.items():
+            repo = {
+                'PER': database.characters,
+                'LOC': database.locations,
+                'ORG': database.organizations
+            }[ent_type]
+            element = repo.find_by_id(ent_uuid)
+            if element:
+                element.properties.update(props)
+                repo.add(element)  # обновляем запись
+
+    def _children_index(self, tokens: List[EventToken]) -> Dict[int, List[EventToken]]:
+        # head_id -> дочерние токены в порядке предложения
+        children: Dict[int, List[EventToken]] = {}
+        for t in tokens:
+            children.setdefault(t.head_id, []).append(t)
+        return children
 
     def _children(
             self,
-            tokens: List[EventToken],
+            children: Dict[int, List[EventToken]],
             head_id: int,
             rels: Tuple[str, ...]
     ) -> List[EventToken]:
-        return [t for t in tokens if t.head_id == head_id and t.rel in rels]
+        return [t for t in children.get(head_id, ()) if t.rel in rels]
 
-    def _collect_subtree(self, tokens: List[EventToken], root_id: int) -> set:
+    def _collect_subtree(self, children: Dict[int, List[EventToken]], root_id: int) -> set:
         ids = {root_id}
-        added = True
-        while added:
-            added = False
-            for t in tokens:
-                if t.head_id in ids and t.id not in ids:
+        queue = deque([root_id])
+        while queue:
+            for t in children.get(queue.popleft(), ()):
+                if t.id not in ids:
                     ids.add(t.id)
-                    added = True
+                    queue.append(t.id)
         return ids
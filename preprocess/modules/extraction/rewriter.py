@@ -0,0 +1,75 @@
+from bisect import bisect_right
+from typing import List, Tuple
+
+
+class OffsetMap:
+    """
+    Отображение позиций между исходным и переписанным текстом.
+    Позиция внутри заменённого фрагмента отображается в начало замены.
+    """
+
+    def __init__(self, edits: List[Tuple[int, int, str]]):
+        """
+        :param edits: Непересекающиеся замены (start, stop, replacement), отсортированные по start.
+        """
+        self._old_starts: List[int] = []
+        self._old_stops: List[int] = []
+        self._new_starts: List[int] = []
+        self._new_stops: List[int] = []
+        shift = 0
+        for start, stop, replacement in edits:
+            self._old_starts.append(start)
+            self._old_stops.append(stop)
+            self._new_starts.append(start + shift)
+            shift += len(replacement) - (stop - start)
+            self._new_stops.append(stop + shift)
+
+    def to_new(self, pos: int) -> int:
+        i = bisect_right(self._old_stops, pos)
+        if i < len(self._old_starts) and self._old_starts[i] < pos:
+            return self._new_starts[i]
+        if i == 0:
+            return pos
+        return pos - self._old_stops[i - 1] + self._new_stops[i - 1]
+
+    def to_old(self, pos: int) -> int:
+        i = bisect_right(self._new_stops, pos)
+        if i < len(self._new_starts) and self._new_starts[i] < pos:
+            return self._old_starts[i]
+        if i == 0:
+            return pos
+        return pos - self._new_stops[i - 1] + self._old_stops[i - 1]
+
+
+class SpanRewriter:
+    """
+    Список правок текста: экстракторы записывают замены (start, stop, replacement),
+    а текст собирается один раз линейным проходом.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.edits: List[Tuple[int, int, str]] = []
+
+    def replace(self, start: int, stop: int, replacement: str):
+        self.edits.append((start, stop, replacement))
+
+    def __len__(self) -> int:
+        return len(self.edits)
+
+    def apply(self) -> Tuple[str, OffsetMap]:
+        """
+        Применяет все записанные замены.
+        :return: Новый текст и отображение позиций.
+        """
+        edits = sorted(self.edits, key=lambda e: e[0])
+        parts: List[str] = []
+        prev = 0
+        for start, stop, replacement in edits:
+            if start < prev:
+                raise ValueError(f"Правка ({start}, {stop}) пересекается с предыдущей")
+            parts.append(self.text[prev:start])
+            parts.append(replacement)
+            prev = stop
+        parts.append(self.text[prev:])
+        return "".join(parts), OffsetMap(edits)
@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from preprocess.modules.markup.models import EventMarkup, TokenColumns, RELS, POSES, FEATS
+
+
+class MarkupCache:
+    """
+    Персистентный кэш разметки предложений в SQLite. Ключ — хэш токенов предложения
+    и версии моделей, значение — объединённая morph+syntax разметка.
+    Размер ограничен max_entries с вытеснением давно не использованных записей (LRU).
+    Файл можно разделять между воркерами пула: каждый процесс открывает своё соединение,
+    база работает в режиме WAL.
+    """
+
+    def __init__(self, path: str, model_version: str = '', max_entries: int = 1_000_000,
+                 evict_interval: int = 10_000):
+        """
+        :param path: Путь к файлу кэша.
+        :param model_version: Версия моделей, входит в ключ.
+        :param max_entries: Максимальное число записей.
+        :param evict_interval: Через сколько вставок проверять размер кэша.
+        """
+        self.path = path
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._inserted = 0
+
+    def key(self, tokens: List[str]) -> str:
+        data = self.model_version + '\x1e' + '\x1f'.join(tokens)
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    def get_many(self, chunk: List[List[str]]) -> Dict[int, EventMarkup]:
+        """
+        Ищет разметку предложений в кэше.
+        :param chunk: Предложения как списки токенов.
+        :return: Найденная разметка по индексам предложений в chunk.
+        """
+        keys: Dict[str, List[int]] = {}
+        for i, tokens in enumerate(chunk):
+            keys.setdefault(self.key(tokens), []).append(i)
+        if not keys:
+            return {}
+
+        found: Dict[int, EventMarkup] = {}
+        with self._lock:
+            conn = self._connection()
+            rows = []
+            key_list = list(keys)
+            for start in range(0, len(key_list), 500):
+                part = key_list[start:start + 500]
+                rows.extend(conn.execute(
+                    f"SELECT key, value FROM markups WHERE key IN ({','.join('?' * len(part))})",
+                    part
+                ).fetchall())
+            if rows:
+                now = time.time()
+                with conn:
+                    conn.executemany(
+                        "UPDATE markups SET last_used = ? WHERE key = ?",
+                        [(now, key) for key, _ in rows]
+                    )
+
+        for key, value in rows:
+            for i in keys[key]:
+                found[i] = self._decode(chunk[i], value)
+        return found
+
+    def put_many(self, items: List[Tuple[List[str], EventMarkup]]):
+        """
+        Сохраняет разметку предложений одной транзакцией.
+        :param items: Пары (токены предложения, разметка).
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [(self.key(tokens), self._encode(markup), now) for tokens, markup in items]
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO markups (key, value, last_used) VALUES (?, ?, ?)",
+                    rows
+                )
+            self._inserted += len(rows)
+            if self._inserted >= self.evict_interval:
+                self._inserted = 0
+                self._evict(conn)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+            self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # соединение SQLite нельзя наследовать через fork, поэтому оно открывается в каждом процессе
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS markups ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS markups_last_used ON markups (last_used)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _evict(self, conn: sqlite3.Connection):
+        count = conn.execute("SELECT COUNT(*) FROM markups").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            with conn:
+                conn.execute(
+                    "DELETE FROM markups WHERE key IN "
+                    "(SELECT key FROM markups ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+
+    @staticmethod
+    def _encode(markup: EventMarkup) -> str:
+        columns = markup.columns
+        return json.dumps([
+            columns.ids.tolist(),
+            columns.head_ids.tolist(),
+            [RELS.decode(code) for code in columns.rels.tolist()],
+            [POSES.decode(code) for code in columns.poses.tolist()],
+            [FEATS.decode(code) for code in columns.feats.tolist()],
+        ], ensure_ascii=False)
+
+    @staticmethod
+    def _decode(tokens: List[str], value: str) -> EventMarkup:
+        ids, head_ids, rels, poses, feats = json.loads(value)
+        return EventMarkup.from_columns(TokenColumns.from_values(ids, head_ids, rels, poses, feats, tokens))
@@ -0,0 +1,76 @@
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+
+class PhraseTrie:
+    """
+    Префиксное дерево по последовательностям токенов: для каждой позиции находит
+    самую длинную фразу словаря, начинающуюся в ней, за один проход по токенам.
+    """
+    # ключ значения в узле; тексты токенов не бывают None, а дерево остаётся сериализуемым pickle
+    _VALUE = None
+
+    def __init__(self):
+        self._root: Dict[Any, Any] = {}
+
+    @classmethod
+    def from_phrases(cls, phrases: Dict[str, Any]) -> 'PhraseTrie':
+        """
+        Строит дерево по фразам, записанным через пробел между токенами.
+        :param phrases: Фраза -> значение.
+        """
+        trie = cls()
+        for phrase, value in phrases.items():
+            trie.add(phrase.split(' '), value)
+        return trie
+
+    def add(self, words: Sequence[str], value: Any):
+        node = self._root
+        for word in words:
+            node = node.setdefault(word, {})
+        node[self._VALUE] = value
+
+    def __bool__(self) -> bool:
+        return bool(self._root)
+
+    def longest_match(self, words: Sequence[str], start: int = 0) -> Optional[Tuple[int, Any]]:
+        """
+        Ищет самую длинную фразу, начинающуюся с позиции start.
+        :param words: Тексты токенов.
+        :param start: Позиция начала.
+        :return: (длина фразы, значение) или None.
+        """
+        best = None
+        for match in self.prefixes(words, start):
+            best = match
+        return best
+
+    def prefixes(self, words: Sequence[str], start: int = 0) -> Iterator[Tuple[int, Any]]:
+        """
+        Перебирает все фразы, начинающиеся с позиции start, по возрастанию длины.
+        :param words: Тексты токенов.
+        :param start: Позиция начала.
+        :return: Пары (длина фразы, значение).
+        """
+        node = self._root
+        for i in range(start, len(words)):
+            node = node.get(words[i])
+            if node is None:
+                return
+            if self._VALUE in node:
+                yield i - start + 1, node[self._VALUE]
+
+    def find_all(self, words: Sequence[str]) -> Iterator[Tuple[int, int, Any]]:
+        """
+        Перебирает непересекающиеся совпадения слева направо, на каждой позиции — самое длинное.
+        :param words: Тексты токенов.
+        :return: Тройки (начало, длина, значение).
+        """
+        i = 0
+        while i < len(words):
+            match = self.longest_match(words, i)
+            if match is None:
+                i += 1
+                continue
+            length, value = match
+            yield i, length, value
+            i += length
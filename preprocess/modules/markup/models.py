@@ -1,7 +1,13 @@
+import threading
+from bisect import bisect_left
 from enum import Enum, auto
-from typing import List
+from typing import List, Dict, Optional, Any, Hashable, Tuple
 
-from slovnet.markup import MorphToken, SyntaxToken
+import numpy as np
+from slovnet.markup import MorphToken, SyntaxToken, MorphMarkup, SyntaxMarkup
+
+# знаки, которые при восстановлении текста приклеиваются к предыдущему токену
+ATTACHED_PUNCT = {'.', ',', '!', '?', ';', ':'}
 
 
 class EventType(Enum):
@@ -11,18 +17,190 @@ class EventType(Enum):
     MIXED = auto()
 
 
+class TokenVocab:
+    """
+    Процессная таблица интернирования: строковое значение (rel, pos) или набор feats
+    хранится один раз, а токены ссылаются на него целочисленным кодом.
+    Таблица общая для потоков процесса: новые значения добавляются под блокировкой.
+    """
+
+    def __init__(self):
+        self._codes: Dict[Hashable, int] = {}
+        self._values: List[Any] = []
+        self._lock = threading.Lock()
+
+    def encode(self, value: Any, key: Optional[Hashable] = None) -> int:
+        key = value if key is None else key
+        code = self._codes.get(key)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(key)
+                if code is None:
+                    # значение появляется в _values раньше, чем код в _codes,
+                    # поэтому чтение без блокировки никогда не получит код без значения
+                    code = len(self._values)
+                    self._values.append(value)
+                    self._codes[key] = code
+        return code
+
+    def decode(self, code: int) -> Any:
+        return self._values[code]
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class FeatsTable(TokenVocab):
+    """
+    Общая таблица морфологических признаков: одинаковые feats разделяют один словарь,
+    поэтому словари из таблицы нельзя изменять на месте.
+    """
+
+    def encode(self, value: Optional[Dict[str, str]], key: Optional[Hashable] = None) -> int:
+        if key is None:
+            key = None if value is None else tuple(sorted(value.items()))
+        return super().encode(value, key)
+
+
+RELS = TokenVocab()
+POSES = TokenVocab()
+FEATS = FeatsTable()
+
+
+class TokenColumns:
+    """
+    Колоночное хранилище токенов одной разметки: id/head_id и коды rel/pos/feats в массивах NumPy,
+    тексты — в списке. version растёт при каждом изменении текста токена.
+    """
+    __slots__ = ('ids', 'head_ids', 'rels', 'poses', 'feats', 'texts', 'version')
+
+    def __init__(self, ids: np.ndarray, head_ids: np.ndarray, rels: np.ndarray,
+                 poses: np.ndarray, feats: np.ndarray, texts: List[str]):
+        self.ids = ids
+        self.head_ids = head_ids
+        self.rels = rels
+        self.poses = poses
+        self.feats = feats
+        self.texts = texts
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @classmethod
+    def from_values(cls, ids: List[int], head_ids: List[int], rels: List[Optional[str]],
+                    poses: List[Optional[str]], feats: List[Optional[Dict[str, str]]],
+                    texts: List[str]) -> 'TokenColumns':
+        return cls(
+            np.array(ids, dtype=np.int32),
+            np.array(head_ids, dtype=np.int32),
+            np.array([RELS.encode(rel) for rel in rels], dtype=np.int32),
+            np.array([POSES.encode(pos) for pos in poses], dtype=np.int32),
+            np.array([FEATS.encode(f) for f in feats], dtype=np.int32),
+            list(texts)
+        )
+
+    @classmethod
+    def from_tokens(cls, tokens: List['EventToken']) -> 'TokenColumns':
+        n = len(tokens)
+        ids = np.empty(n, dtype=np.int32)
+        head_ids = np.empty(n, dtype=np.int32)
+        rels = np.empty(n, dtype=np.int32)
+        poses = np.empty(n, dtype=np.int32)
+        feats = np.empty(n, dtype=np.int32)
+        texts: List[str] = []
+        for i, tok in enumerate(tokens):
+            src, row = tok._columns, tok._row
+            ids[i] = src.ids[row]
+            head_ids[i] = src.head_ids[row]
+            rels[i] = src.rels[row]
+            poses[i] = src.poses[row]
+            feats[i] = src.feats[row]
+            texts.append(src.texts[row])
+        return cls(ids, head_ids, rels, poses, feats, texts)
+
+
 class EventToken:
+    """
+    Представление одного токена поверх TokenColumns. Токен, созданный напрямую,
+    хранит значения в собственном однострочном хранилище.
+    """
+    __slots__ = ('_columns', '_row')
+
     def __init__(self, morph: MorphToken, syntax: SyntaxToken):
         if morph.text != syntax.text:
             raise ValueError(
                 f"morph.text ({morph.text}) != syntax.text ({syntax.text})"
             )
-        self.id = syntax.id
-        self.head_id = syntax.head_id
-        self.rel = syntax.rel
-        self.text = morph.text
-        self.pos = morph.pos
-        self.feats = morph.feats
+        self._columns = TokenColumns.from_values(
+            [int(syntax.id)], [int(syntax.head_id)], [syntax.rel],
+            [morph.pos], [morph.feats], [morph.text]
+        )
+        self._row = 0
+
+    @classmethod
+    def create(cls, id: int, head_id: int, rel: Optional[str], text: str,
+               pos: Optional[str], feats: Optional[Dict[str, str]]) -> 'EventToken':
+        token = cls.__new__(cls)
+        token._columns = TokenColumns.from_values([id], [head_id], [rel], [pos], [feats], [text])
+        token._row = 0
+        return token
+
+    @classmethod
+    def view(cls, columns: TokenColumns, row: int) -> 'EventToken':
+        token = cls.__new__(cls)
+        token._columns = columns
+        token._row = row
+        return token
+
+    @property
+    def id(self) -> int:
+        return int(self._columns.ids[self._row])
+
+    @id.setter
+    def id(self, value: int):
+        self._columns.ids[self._row] = value
+
+    @property
+    def head_id(self) -> int:
+        return int(self._columns.head_ids[self._row])
+
+    @head_id.setter
+    def head_id(self, value: int):
+        self._columns.head_ids[self._row] = value
+
+    @property
+    def rel(self) -> Optional[str]:
+        return RELS.decode(self._columns.rels[self._row])
+
+    @rel.setter
+    def rel(self, value: Optional[str]):
+        self._columns.rels[self._row] = RELS.encode(value)
+
+    @property
+    def text(self) -> str:
+        return self._columns.texts[self._row]
+
+    @text.setter
+    def text(self, value: str):
+        self._columns.texts[self._row] = value
+        self._columns.version += 1
+
+    @property
+    def pos(self) -> Optional[str]:
+        return POSES.decode(self._columns.poses[self._row])
+
+    @pos.setter
+    def pos(self, value: Optional[str]):
+        self._columns.poses[self._row] = POSES.encode(value)
+
+    @property
+    def feats(self) -> Optional[Dict[str, str]]:
+        return FEATS.decode(self._columns.feats[self._row])
+
+    @feats.setter
+    def feats(self, value: Optional[Dict[str, str]]):
+        self._columns.feats[self._row] = FEATS.encode(value)
 
     def __repr__(self) -> str:
         return (
@@ -43,26 +221,94 @@ class EventMarkup:
 
     def __init__(self, tokens: List[EventToken], event_type: EventType = EventType.UNKNOWN):
         self.type = event_type
+        self._rendered = None
         self.tokens = tokens
 
+    @classmethod
+    def from_slovnet(cls, morph_markup: MorphMarkup, syntax_markup: SyntaxMarkup,
+                     event_type: EventType = EventType.UNKNOWN) -> 'EventMarkup':
+        """
+        Собирает колонки разметки напрямую из токенов slovnet, без промежуточных EventToken.
+        """
+        morph_tokens = morph_markup.tokens
+        syntax_tokens = syntax_markup.tokens
+        for m, s in zip(morph_tokens, syntax_tokens):
+            if m.text != s.text:
+                raise ValueError(f"morph.text ({m.text}) != syntax.text ({s.text})")
+        return cls.from_columns(TokenColumns.from_values(
+            [int(s.id) for s in syntax_tokens],
+            [int(s.head_id) for s in syntax_tokens],
+            [s.rel for s in syntax_tokens],
+            [m.pos for m in morph_tokens],
+            [m.feats for m in morph_tokens],
+            [m.text for m in morph_tokens]
+        ), event_type)
+
+    @classmethod
+    def from_columns(cls, columns: TokenColumns,
+                     event_type: EventType = EventType.UNKNOWN) -> 'EventMarkup':
+        markup = cls.__new__(cls)
+        markup.type = event_type
+        markup._columns = columns
+        markup._tokens = None
+        markup._rendered = None
+        return markup
+
+    @property
+    def columns(self) -> TokenColumns:
+        return self._columns
+
+    @property
+    def tokens(self) -> List[EventToken]:
+        # список представлений кэшируется; изменения состава токенов вносятся только присваиванием tokens
+        if self._tokens is None:
+            self._tokens = [EventToken.view(self._columns, row) for row in range(len(self._columns))]
+        return self._tokens
+
+    @tokens.setter
+    def tokens(self, tokens: List[EventToken]):
+        columns = TokenColumns.from_tokens(tokens)
+        for row, tok in enumerate(tokens):
+            tok._columns = columns
+            tok._row = row
+        self._columns = columns
+        self._tokens = list(tokens)
+
     def __repr__(self) -> str:
         return (f"EventMarkup(text={self.__str__()}\n"
                 f"type={self.type} tokens=[{', '.join(repr(t) for t in self.tokens)}])")
 
+    def render(self) -> Tuple[str, List[int]]:
+        """
+        Восстанавливает фразу из токенов: токены через пробел, знаки из ATTACHED_PUNCT
+        приклеиваются к предыдущему. Результат кэшируется до замены токенов или их текстов.
+        :return: Текст фразы и смещения начала токенов в нём.
+        """
+        columns = self._columns
+        if self._rendered is None or self._rendered[0] is not columns or self._rendered[1] != columns.version:
+            parts: List[str] = []
+            starts: List[int] = []
+            offset = 0
+            for text in columns.texts:
+                if parts and text not in ATTACHED_PUNCT:
+                    parts.append(" ")
+                    offset += 1
+                starts.append(offset)
+                parts.append(text)
+                offset += len(text)
+            self._rendered = (columns, columns.version, ("".join(parts), starts))
+        return self._rendered[2]
+
     def __str__(self) -> str:
         # вернёт саму фразу, восстановленную из токенов
-        parts: List[str] = []
-        for tok in self.tokens:
-            if parts and tok.text in {'.', ',', '!', '?', ';', ':'}:
-                parts[-1] += tok.text
-            else:
-                parts.append(tok.text)
-        return " ".join(parts)
+        return self.render()[0]
 
 
 class EventMarkupBlock:
     def __init__(self, markups: List[EventMarkup]):
         self.markups = markups
+        # отрисовки разметок, по которым построен кэш текста, и сам кэш с индексом токенов
+        self._rendered = None
 
     def __iter__(self):
         return iter(self.markups)
@@ -73,11 +319,55 @@ class EventMarkupBlock:
     def __getitem__(self, idx):
         return self.markups[idx]
 
+    @property
+    def text(self) -> str:
+        """
+        Текст блока: фразы разметок через пробел. Кэшируется и пересобирается,
+        только если изменилась разметка какой-либо фразы или их список.
+        """
+        return self._index()[0]
+
+    def token_range(self, start: int, stop: int) -> Optional[Tuple[int, int, int]]:
+        """
+        Токены одной разметки, точно покрывающие отрезок text[start:stop].
+        :return: (номер разметки, номер первого токена, число токенов) или None,
+            если границы отрезка не совпадают с границами токенов одной разметки.
+        """
+        _, starts, stops, positions = self._index()
+        lo = bisect_left(starts, start)
+        hi = bisect_left(stops, stop)
+        if lo >= len(starts) or hi >= len(stops) or starts[lo] != start or stops[hi] != stop or lo > hi:
+            return None
+        (m_idx, first), (last_m_idx, last) = positions[lo], positions[hi]
+        if m_idx != last_m_idx:
+            return None
+        return m_idx, first, last - first + 1
+
+    def _index(self) -> Tuple[str, List[int], List[int], List[Tuple[int, int]]]:
+        rendered = [em.render() for em in self.markups]
+        cached = self._rendered
+        if cached is not None and len(cached[0]) == len(rendered) \
+                and all(a is b for a, b in zip(cached[0], rendered)):
+            return cached[1]
+        starts: List[int] = []
+        stops: List[int] = []
+        positions: List[Tuple[int, int]] = []
+        offset = 0
+        for m_idx, (text, token_starts) in enumerate(rendered):
+            if m_idx:
+                offset += 1
+            for t_idx, token_start in enumerate(token_starts):
+                start = offset + token_start
+                starts.append(start)
+                stops.append(start + len(self.markups[m_idx].columns.texts[t_idx]))
+                positions.append((m_idx, t_idx))
+            offset += len(text)
+        index = (" ".join(text for text, _ in rendered), starts, stops, positions)
+        self._rendered = (rendered, index)
+        return index
+
     def __str__(self) -> str:
-        parts: List[str] = []
-        for em in self.markups:
-            parts.append(str(em))
-        return " ".join(parts)
+        return self.text
 
     def __repr__(self) -> str:
         parts: List[str] = []
@@ -1,36 +1,86 @@
-from typing import List
+from typing import List, Optional, Dict, Tuple
 
 from slovnet.markup import MorphMarkup, SyntaxMarkup
 
-from preprocess.modules.markup.models import EventMarkup, EventToken, EventMarkupBlock
+from preprocess.modules.markup.cache import MarkupCache
+from preprocess.modules.markup.models import EventMarkup, EventMarkupBlock, TokenColumns
+from preprocess.modules.markup.processors.batching import SentenceBatcher
 from preprocess.modules.markup.processors.event_type import EventTypeClassifier
 from preprocess.modules.markup.processors.morph import MorphProcessor
 from preprocess.modules.markup.processors.syntax import SyntaxProcessor
+from preprocess.modules.markup.segmentation import Segmentation
 
 
 class MarkupPipeline:
-    def __init__(self):
-        self.morph = MorphProcessor()
-        self.syntax = SyntaxProcessor()
+    def __init__(self, batcher: Optional[SentenceBatcher] = None, cache: Optional[MarkupCache] = None):
+        """
+        :param batcher: Раскладка предложений по батчам slovnet.
+        :param cache: Персистентный кэш разметки предложений; без него модели запускаются на каждом предложении.
+        """
+        self.batcher = batcher or SentenceBatcher()
+        self.cache = cache
+        self.morph = MorphProcessor(self.batcher)
+        self.syntax = SyntaxProcessor(self.batcher)
         self.type_classifier = EventTypeClassifier()
 
+    def segment(self, text: str) -> Segmentation:
+        return Segmentation.from_text(text)
+
     def process(self, text: str) -> EventMarkupBlock:
-        morph_markups: List[MorphMarkup] = self.morph.process(text)
-        syntax_markups: List[SyntaxMarkup] = self.syntax.process(text)
+        return self.process_many([text])[0]
 
-        if len(morph_markups) != len(syntax_markups):
-            raise ValueError(f"...")
+    def process_many(self, texts: List[str]) -> List[EventMarkupBlock]:
+        """
+        Размечает несколько текстов за один проход моделей: предложения всех текстов
+        упаковываются в общие батчи slovnet, а разметка затем раскладывается обратно по текстам.
+        :param texts: Тексты (абзацы).
+        :return: Блоки разметки в порядке текстов.
+        """
+        segmentations = [self.segment(text) for text in texts]
+        chunk: List[List[str]] = []
+        for segmentation in segmentations:
+            chunk.extend(segmentation.chunk)
+
+        markups = self._markup_chunk(chunk)
+        for em, event_type in zip(markups, self.type_classifier.classify_many(markups)):
+            em.type = event_type
+
+        blocks: List[EventMarkupBlock] = []
+        offset = 0
+        for segmentation in segmentations:
+            count = len(segmentation.sentences)
+            block_markups = markups[offset:offset + count]
+            offset += count
+            blocks.append(EventMarkupBlock(block_markups))
+        return blocks
 
-        markups: List[EventMarkup] = []
-        for m_mkp, s_mkp in zip(morph_markups, syntax_markups):
-            if len(m_mkp.tokens) != len(s_mkp.tokens):
-                raise ValueError(f"...")
-            tokens = [EventToken(m, s) for m, s in zip(m_mkp.tokens, s_mkp.tokens)]
-            em = EventMarkup(tokens)
-            em.type = self.type_classifier.classify(em)
-            markups.append(em)
+    def _markup_chunk(self, chunk: List[List[str]]) -> List[EventMarkup]:
+        if self.cache is None:
+            return self._infer(chunk)
 
-        return EventMarkupBlock(markups)
+        markups: List[Optional[EventMarkup]] = [None] * len(chunk)
+        for i, markup in self.cache.get_many(chunk).items():
+            markups[i] = markup
+
+        # повторяющиеся среди промахов предложения размечаются один раз
+        misses: Dict[Tuple[str, ...], List[int]] = {}
+        for i, markup in enumerate(markups):
+            if markup is None:
+                misses.setdefault(tuple(chunk[i]), []).append(i)
+        if misses:
+            miss_chunk = [list(tokens) for tokens in misses]
+            inferred = self._infer(miss_chunk)
+            self.cache.put_many(list(zip(miss_chunk, inferred)))
+            for indexes, markup in zip(misses.values(), inferred):
+                markups[indexes[0]] = markup
+                for i in indexes[1:]:
+                    markups[i] = EventMarkup.from_columns(TokenColumns.from_tokens(markup.tokens))
+        return markups
+
+    def _infer(self, chunk: List[List[str]]) -> List[EventMarkup]:
+        morph_markups: List[MorphMarkup] = self.morph.process(chunk)
+        syntax_markups: List[SyntaxMarkup] = self.syntax.process(chunk)
+        return self._merge(morph_markups, syntax_markups)
 
     def _merge(
             self,
@@ -55,10 +105,6 @@ class MarkupPipeline:
                     f"не совпадает с количеством токенов syntax ({len(syntax_tokens)})"
                 )
 
-            event_tokens = [
-                EventToken(m, s) for m, s in zip(morph_tokens, syntax_tokens)
-            ]
-
-            event_markups.append(EventMarkup(event_tokens))
+            event_markups.append(EventMarkup.from_slovnet(m_mkp, s_mkp))
 
         return event_markups
@@ -0,0 +1,59 @@
+from bisect import bisect_left
+from typing import List, Iterator, Sequence, Any
+
+
+class SentenceBatcher:
+    """
+    Раскладывает предложения по батчам slovnet с группировкой по длине:
+    предложения сортируются, делятся на корзины по границам длины и режутся на батчи
+    с ограничением по числу предложений и по числу токенов с учётом паддинга.
+    Результаты модели возвращаются в исходном порядке.
+    """
+
+    def __init__(self,
+                 batch_size: int = 64,
+                 bucket_boundaries: Sequence[int] = (8, 16, 32, 64),
+                 max_tokens: int = 2048):
+        """
+        :param batch_size: Максимум предложений в батче.
+        :param bucket_boundaries: Границы корзин по длине предложения в токенах (по возрастанию).
+        :param max_tokens: Максимум токенов в батче с учётом паддинга (длина × число предложений).
+        """
+        self.batch_size = batch_size
+        self.bucket_boundaries = sorted(bucket_boundaries)
+        self.max_tokens = max_tokens
+
+    def batches(self, chunk: List[List[str]]) -> Iterator[List[int]]:
+        """
+        Возвращает батчи как списки индексов предложений из chunk.
+        """
+        order = sorted(range(len(chunk)), key=lambda i: len(chunk[i]))
+
+        batch: List[int] = []
+        bucket = None
+        for i in order:
+            length = len(chunk[i])
+            i_bucket = bisect_left(self.bucket_boundaries, length)
+            # предложения отсортированы, поэтому длина i — максимальная в батче
+            if batch and (
+                    i_bucket != bucket
+                    or len(batch) >= self.batch_size
+                    or (len(batch) + 1) * length > self.max_tokens
+            ):
+                yield batch
+                batch = []
+            batch.append(i)
+            bucket = i_bucket
+        if batch:
+            yield batch
+
+    def map(self, model, chunk: List[List[str]]) -> List[Any]:
+        """
+        Прогоняет chunk через model.map по батчам и восстанавливает исходный порядок.
+        """
+        results: List[Any] = [None] * len(chunk)
+        for indexes in self.batches(chunk):
+            markups = model.map([chunk[i] for i in indexes])
+            for i, markup in zip(indexes, markups):
+                results[i] = markup
+        return results
@@ -1,4 +1,9 @@
-from preprocess.modules.markup.models import EventMarkup, EventType
+import threading
+from typing import List, Dict
+
+import numpy as np
+
+from preprocess.modules.markup.models import EventMarkup, EventType, RELS, POSES, FEATS
 
 
 class EventTypeClassifier:
@@ -18,45 +23,67 @@ class EventTypeClassifier:
         "nmod"  # номинальный модификатор
     }
 
+    # таблицы весов по кодам словарей RELS/POSES/FEATS; дополняются по мере роста словарей
+    _tables: Dict[str, np.ndarray] = {
+        'dynamic_pos': np.zeros(0, dtype=np.int32),
+        'static_pos': np.zeros(0, dtype=np.int32),
+        'dynamic_rel': np.zeros(0, dtype=np.int32),
+        'static_rel': np.zeros(0, dtype=np.int32),
+        'feats': np.zeros(0, dtype=np.int32),
+    }
+    _tables_lock = threading.Lock()
+
     @classmethod
     def classify(cls, markup: EventMarkup) -> EventType:
-        dynamic_score = 0
-        static_score = 0
+        return cls.classify_many([markup])[0]
+
+    @classmethod
+    def classify_many(cls, markups: List[EventMarkup]) -> List[EventType]:
+        """
+        Классифицирует сразу несколько разметок: баллы динамики и статики считаются
+        векторно по кодам pos/rel/feats из колонок всех предложений.
+        :param markups: Разметки предложений одного или нескольких блоков.
+        :return: Типы событий в порядке разметок.
+        """
+        if not markups:
+            return []
+        columns = [em.columns for em in markups]
+        lengths = np.array([len(c) for c in columns], dtype=np.int64)
+        if not lengths.sum():
+            return [cls._decide(0, 0, 0) for _ in markups]
+
+        ids = np.concatenate([c.ids for c in columns])
+        head_ids = np.concatenate([c.head_ids for c in columns])
+        rels = np.concatenate([c.rels for c in columns])
+        poses = np.concatenate([c.poses for c in columns])
+        feats = np.concatenate([c.feats for c in columns])
+        tables = cls._get_tables()
 
-        for tok in markup.tokens:
-            pos = tok.pos
-            rel = tok.rel
-            feats = tok.feats or {}
+        # 1) Сильные маркеры динамики
+        # 1.1) Если корень‑глагол; 2.1) если корень‑имя/прилагательное/наречие
+        is_root = ids == head_ids
+        dynamic = np.where(is_root, tables['dynamic_pos'][poses], 0)
+        static = np.where(is_root, tables['static_pos'][poses], 0)
+        # 1.2) Отношения, указывающие на аргументы действия / придаточные
+        dynamic += tables['dynamic_rel'][rels]
+        # 1.3–1.5) Морфо‑признаки времени/аспекта, императив, пассив
+        dynamic += tables['feats'][feats]
+        # 2.2) Отношения атрибуции и номинальных модификаторов
+        static += tables['static_rel'][rels]
 
-            # 1) Сильные маркеры динамики
-            # 1.1) Если корень‑глагол
-            if tok.id == tok.head_id and pos in cls.DYNAMIC_POS:
-                dynamic_score += 2
-            # 1.2) Отношения, указывающие на аргументы действия / придаточные
-            if rel in cls.DYNAMIC_RELS:
-                dynamic_score += 1
-            # 1.3) Морфо‑признаки времени/аспекта
-            if feats.get("Aspect") == "Perf":
-                dynamic_score += 1
-            if feats.get("Tense") in {"Past", "Fut"}:
-                dynamic_score += 1
-            # 1.4) Императив
-            if feats.get("Mood") == "Imp":
-                dynamic_score += 1
-            # 1.5) Пассивная конструкция
-            if feats.get("Voice") == "Pass":
-                dynamic_score += 1
+        segments = np.repeat(np.arange(len(markups)), lengths)
+        dynamic_scores = np.bincount(segments, weights=dynamic, minlength=len(markups))
+        static_scores = np.bincount(segments, weights=static, minlength=len(markups))
+        return [
+            cls._decide(int(d), int(s), int(n))
+            for d, s, n in zip(dynamic_scores, static_scores, lengths)
+        ]
 
-            # 2) Сильные маркеры статики
-            # 2.1) Если корень‑имя/прилагательное/наречие
-            if tok.id == tok.head_id and pos in cls.STATIC_POS:
-                static_score += 2
-            # 2.2) Отношения атрибуции и номинальных модификаторов
-            if rel in cls.STATIC_RELS:
-                static_score += 1
+    @staticmethod
+    def _decide(dynamic_score: int, static_score: int, length: int) -> EventType:
         # 3) Классификация по набранным баллам
         required = 2
-        if len(markup.tokens) < 3:
+        if length < 3:
             required = 1
         if dynamic_score > required >= static_score:
             return EventType.DYNAMIC
@@ -65,3 +92,42 @@ class EventTypeClassifier:
         if dynamic_score > required and static_score > required:
             return EventType.MIXED
         return EventType.UNKNOWN
+
+    @classmethod
+    def _get_tables(cls) -> Dict[str, np.ndarray]:
+        tables = cls._tables
+        if len(tables['dynamic_pos']) >= len(POSES) and len(tables['dynamic_rel']) >= len(RELS) \
+                and len(tables['feats']) >= len(FEATS):
+            return tables
+        # таблицы пересобираются в новый словарь и подменяются целиком: поток, читающий
+        # прежний снимок, не увидит таблицы короче уже выданных ему кодов
+        with cls._tables_lock:
+            tables = dict(cls._tables)
+            if len(tables['dynamic_pos']) < len(POSES):
+                values = [POSES.decode(code) for code in range(len(POSES))]
+                tables['dynamic_pos'] = np.array([2 if v in cls.DYNAMIC_POS else 0 for v in values], dtype=np.int32)
+                tables['static_pos'] = np.array([2 if v in cls.STATIC_POS else 0 for v in values], dtype=np.int32)
+            if len(tables['dynamic_rel']) < len(RELS):
+                values = [RELS.decode(code) for code in range(len(RELS))]
+                tables['dynamic_rel'] = np.array([1 if v in cls.DYNAMIC_RELS else 0 for v in values], dtype=np.int32)
+                tables['static_rel'] = np.array([1 if v in cls.STATIC_RELS else 0 for v in values], dtype=np.int32)
+            if len(tables['feats']) < len(FEATS):
+                tables['feats'] = np.array(
+                    [cls._feats_score(FEATS.decode(code) or {}) for code in range(len(FEATS))],
+                    dtype=np.int32
+                )
+            cls._tables = tables
+        return tables
+
+    @staticmethod
+    def _feats_score(feats: Dict[str, str]) -> int:
+        score = 0
+        if feats.get("Aspect") == "Perf":
+            score += 1
+        if feats.get("Tense") in {"Past", "Fut"}:
+            score += 1
+        if feats.get("Mood") == "Imp":
+            score += 1
+        if feats.get("Voice") == "Pass":
+            score += 1
+        return score
@@ -1,19 +1,16 @@
-from navec import Navec
-from razdel import sentenize, tokenize
-from slovnet import Morph
+from typing import List, Optional
+
 from slovnet.markup import MorphMarkup
 
+from preprocess.models.registry import ModelRegistry
+from preprocess.modules.markup.processors.batching import SentenceBatcher
+
 
 class MorphProcessor:
-    def __init__(self):
-        self.navec = Navec.load('models/navec_news_v1_1B_250K_300d_100q.tar')
-        self.morph = Morph.load('models/slovnet_morph_news_v1.tar')
-        self.morph.navec(self.navec)
+    def __init__(self, batcher: Optional[SentenceBatcher] = None):
+        self.batcher = batcher or SentenceBatcher()
+        self.morph = ModelRegistry.morph(batch_size=self.batcher.batch_size)
 
-    def process(self, text) -> list[MorphMarkup]:
-        chunk = []
-        for sent in sentenize(text):
-            tokens = [token.text for token in tokenize(sent.text)]
-            chunk.append(tokens)
-        markups = list(self.morph.map(chunk))
+    def process(self, chunk: List[List[str]]) -> list[MorphMarkup]:
+        markups = self.batcher.map(self.morph, chunk)
         return markups
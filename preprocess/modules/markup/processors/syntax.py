@@ -1,19 +1,16 @@
-from navec import Navec
-from razdel import sentenize, tokenize
-from slovnet import Syntax
+from typing import List, Optional
+
 from slovnet.markup import SyntaxMarkup
 
+from preprocess.models.registry import ModelRegistry
+from preprocess.modules.markup.processors.batching import SentenceBatcher
+
 
 class SyntaxProcessor:
-    def __init__(self):
-        self.navec = Navec.load('models/navec_news_v1_1B_250K_300d_100q.tar')
-        self.syntax = Syntax.load('models/slovnet_syntax_news_v1.tar')
-        self.syntax.navec(self.navec)
+    def __init__(self, batcher: Optional[SentenceBatcher] = None):
+        self.batcher = batcher or SentenceBatcher()
+        self.syntax = ModelRegistry.syntax(batch_size=self.batcher.batch_size)
 
-    def process(self, text) -> list[SyntaxMarkup]:
-        chunk = []
-        for sent in sentenize(text):
-            tokens = [token.text for token in tokenize(sent.text)]
-            chunk.append(tokens)
-        markups = list(self.syntax.map(chunk))
+    def process(self, chunk: List[List[str]]) -> list[SyntaxMarkup]:
+        markups = self.batcher.map(self.syntax, chunk)
         return markups
@@ -0,0 +1,106 @@
+from typing import List, Tuple
+
+from razdel import sentenize, tokenize
+from razdel.substring import Substring
+
+from preprocess.modules.extraction.rewriter import SpanRewriter
+from preprocess.modules.markup.models import EventMarkup
+
+
+class SegmentedSentence:
+    def __init__(self, start: int, stop: int, tokens: List[Substring]):
+        self.start = start
+        self.stop = stop
+        self.tokens = tokens
+
+    def __repr__(self) -> str:
+        return f"SegmentedSentence(start={self.start}, stop={self.stop}, tokens={self.tokens})"
+
+
+class Segmentation:
+    """
+    Результат единственного прохода сегментации: предложения и токены
+    с абсолютными смещениями в тексте.
+    """
+
+    def __init__(self, text: str, sentences: List[SegmentedSentence]):
+        self.text = text
+        self.sentences = sentences
+
+    @property
+    def chunk(self) -> List[List[str]]:
+        return [[token.text for token in sent.tokens] for sent in self.sentences]
+
+    @property
+    def tokens(self) -> List[Substring]:
+        return [token for sent in self.sentences for token in sent.tokens]
+
+    @classmethod
+    def from_text(cls, text: str) -> 'Segmentation':
+        sentences: List[SegmentedSentence] = []
+        for sent in sentenize(text):
+            tokens = [
+                Substring(sent.start + token.start, sent.start + token.stop, token.text)
+                for token in tokenize(sent.text)
+            ]
+            sentences.append(SegmentedSentence(sent.start, sent.stop, tokens))
+        return cls(text, sentences)
+
+    @classmethod
+    def from_markups(cls, markups: List[EventMarkup]) -> 'Segmentation':
+        """
+        Строит сегментацию текста, восстановленного из разметки (как str(EventMarkupBlock)),
+        без повторной токенизации: токены взаимно однозначно соответствуют токенам разметки.
+        """
+        parts: List[str] = []
+        sentences: List[SegmentedSentence] = []
+        offset = 0
+        for em in markups:
+            if parts:
+                offset += 1
+            text, starts = em.render()
+            tokens = [
+                Substring(offset + start, offset + start + len(token_text), token_text)
+                for start, token_text in zip(starts, em.columns.texts)
+            ]
+            sentences.append(SegmentedSentence(offset, offset + len(text), tokens))
+            parts.append(text)
+            offset += len(text)
+        return cls(" ".join(parts), sentences)
+
+    def replace(self, edits: List[Tuple[int, int, str]]) -> 'Segmentation':
+        """
+        Применяет замены (start, stop, replacement) к тексту. Токены, задетые заменой,
+        сворачиваются в один токен с текстом замены, остальные сдвигаются.
+        :param edits: Непересекающиеся замены, отсортированные по start.
+        :return: Новая сегментация.
+        """
+        if not edits:
+            return self
+
+        rewriter = SpanRewriter(self.text)
+        for start, stop, replacement in edits:
+            rewriter.replace(start, stop, replacement)
+        text, offsets = rewriter.apply()
+
+        sentences: List[SegmentedSentence] = []
+        e = 0
+        emitted = -1
+        for sent in self.sentences:
+            tokens: List[Substring] = []
+            for token in sent.tokens:
+                while e < len(edits) and edits[e][1] <= token.start:
+                    e += 1
+                if e < len(edits) and edits[e][0] < token.stop:
+                    start, _, replacement = edits[e]
+                    new_start = offsets.to_new(start)
+                    if replacement and emitted != e:
+                        tokens.append(Substring(new_start, new_start + len(replacement), replacement))
+                        emitted = e
+                    continue
+                new_start = offsets.to_new(token.start)
+                tokens.append(Substring(new_start, new_start + len(token.text), token.text))
+            sent_start = tokens[0].start if tokens else sent.start
+            sent_stop = tokens[-1].stop if tokens else sent.start
+            sentences.append(SegmentedSentence(sent_start, sent_stop, tokens))
+        return Segmentation(text, sentences)
@@ -1,7 +1,7 @@
 from typing import List
 
 from preprocess.modules.markup.models import EventMarkupBlock
-from preprocess.modules.markup.pipeline import EventToken
+from preprocess.modules.markup.models import EventToken
 
 
 class SentenceRearrangePipeline:
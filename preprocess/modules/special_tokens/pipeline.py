@@ -1,55 +1,103 @@
+import hashlib
 import os
-from typing import Dict, List
+import pickle
+import tempfile
+from typing import Dict, Optional, Tuple
 
 import pandas as pd
 
+from preprocess.modules.markup.matching import PhraseTrie
 from preprocess.modules.markup.models import EventToken, EventMarkupBlock
 
 
 class SpecialTokensPipeline:
-    def __init__(self, mapping_path: str = './modules/special_tokens/resources/special_token_mappings.csv'):
-        # делаем все ключи в lower()
-        self.special_tokens: Dict[str, str] = {
-            k.lower(): v
-            for k, v in self._load_special_tokens(mapping_path).items()
-        }
-        # сортируем фразы по длине (числу слов), чтобы сначала шли самые длинные
-        self.sorted_phrases: List[str] = sorted(
-            self.special_tokens.keys(),
-            key=lambda s: len(s.split()),
-            reverse=True
-        )
+    def __init__(self, mapping_path: str = './modules/special_tokens/resources/special_token_mappings.csv',
+                 cache_path: Optional[str] = None):
+        """
+        :param mapping_path: CSV с колонками Text и SpecialToken.
+        :param cache_path: Файл кэша собранного словаря; по умолчанию — в пользовательском каталоге кэша.
+        """
+        # делаем все ключи в lower() и собираем дерево фраз по словам
+        cache_path = cache_path or self._default_cache_path(mapping_path)
+        self.special_tokens, self.phrases = self._load(mapping_path, cache_path)
 
     def process(self, block: EventMarkupBlock) -> EventMarkupBlock:
         for markup in block:
             tokens = markup.tokens
+            texts = [t.text.lower() for t in tokens]
             i = 0
             while i < len(tokens):
-                matched = False
-                for phrase in self.sorted_phrases:
-                    words = phrase.split()
-                    L = len(words)
-                    if i + L <= len(tokens) and all(
-                            tokens[i + j].text.lower() == words[j] for j in range(L)
-                    ):
-                        parent = tokens[i]
-                        new_tok = EventToken.__new__(EventToken)
-                        new_tok.id = parent.id
-                        new_tok.head_id = parent.head_id
-                        new_tok.rel = parent.rel
-                        new_tok.text = self.special_tokens[phrase]
-                        new_tok.pos = parent.pos
-                        new_tok.feats = parent.feats
-                        tokens[i: i + L] = [new_tok]
-                        matched = True
-                        break
-                if not matched:
+                # самая длинная фраза с позиции i; после замены позиция не сдвигается
+                match = self.phrases.longest_match(texts, i)
+                if match is None:
                     i += 1
+                    continue
+                L, special_token = match
+                parent = tokens[i]
+                new_tok = EventToken.create(
+                    id=parent.id,
+                    head_id=parent.head_id,
+                    rel=parent.rel,
+                    text=special_token,
+                    pos=parent.pos,
+                    feats=parent.feats
+                )
+                tokens[i: i + L] = [new_tok]
+                texts[i: i + L] = [special_token.lower()]
             markup.tokens = tokens
         return block
 
-    def _load_special_tokens(self, path: str) -> Dict[str, str]:
+    def _load(self, path: str, cache_path: str) -> Tuple[Dict[str, str], PhraseTrie]:
         if not os.path.exists(path):
-            return {}
+            return {}, PhraseTrie()
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, special_tokens, phrases = pickle.load(f)
+            if cached_key == key:
+                return special_tokens, phrases
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            # кэша нет, он обрезан или записан другой версией классов; собираем заново
+            pass
+
+        special_tokens = {
+            k.lower(): v
+            for k, v in self._load_special_tokens(path).items()
+        }
+        phrases = PhraseTrie()
+        for phrase, special_token in special_tokens.items():
+            words = phrase.split()
+            if words:
+                phrases.add(words, special_token)
+        self._write_cache(cache_path, (key, special_tokens, phrases))
+        return special_tokens, phrases
+
+    @staticmethod
+    def _default_cache_path(mapping_path: str) -> str:
+        # $XDG_CACHE_HOME/dramaturge или ~/.cache/dramaturge; имя файла — по абсолютному пути CSV
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        digest = hashlib.sha1(os.path.abspath(mapping_path).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(cache_dir, 'dramaturge', f'special_tokens-{digest}.pickle')
+
+    @staticmethod
+    def _write_cache(cache_path: str, value):
+        # воркеры пишут кэш одновременно: пишем во временный файл рядом и атомарно подменяем,
+        # чтобы читатель не увидел файл записанным наполовину
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(cache_path) or '.', prefix=os.path.basename(cache_path) + '.', suffix='.tmp'
+            )
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            # кэш необязателен: без доступа на запись словарь просто собирается заново
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _load_special_tokens(self, path: str) -> Dict[str, str]:
         df = pd.read_csv(path)
         return {row['Text']: row['SpecialToken'] for _, row in df.iterrows()}
@@ -1,5 +1,7 @@
-from typing import Optional
+import uuid
+from typing import Optional, List, Dict
 
+from hors.models.parser_models import DateTimeToken
 from hors.partial_date.partial_datetime import PartialDateTime
 from icecream import icecream
 
@@ -9,7 +11,10 @@ from preprocess.modules.extraction.date.pipeline import DateExtractionPipeline
 from preprocess.modules.extraction.direct_speech.pipeline import DirectSpeechExtractionPipeline
 from preprocess.modules.extraction.entity.pipeline import EntityExtractionPipeline
 from preprocess.modules.extraction.properties.pipeline import PropertiesExtractionPipeline
+from preprocess.modules.markup.cache import MarkupCache
+from preprocess.modules.markup.models import EventMarkupBlock
 from preprocess.modules.markup.pipeline import MarkupPipeline
+from preprocess.modules.markup.processors.batching import SentenceBatcher
 from preprocess.modules.rearrange.pipeline import SentenceRearrangePipeline
 from preprocess.modules.special_tokens.pipeline import SpecialTokensPipeline
 from preprocess.regex_templates.template import RegexTemplate
@@ -18,24 +23,57 @@ from story_elements.database import StoryElementsDatabase
 
 class EventPreprocessor:
     def __init__(self, regex_template: RegexTemplate = RegexTemplate(),
-                 story_elements_database: StoryElementsDatabase = StoryElementsDatabase()):
-        self.elems_database = story_elements_database
-        self.cleanup = CleanupPipeline(regex_template.cleanup_regexes)
-        self.markup = MarkupPipeline()
+                 story_elements_database: Optional[StoryElementsDatabase] = None,
+                 markup_batcher: Optional[SentenceBatcher] = None,
+                 markup_cache: Optional[MarkupCache] = None,
+                 extract_properties: bool = False):
+        # без явной базы препроцессор получает собственную, не разделяемую с другими
+        self.elems_database = story_elements_database or StoryElementsDatabase()
+        self.cleanup = CleanupPipeline(regex_template.cleanup_program)
+        self.markup = MarkupPipeline(markup_batcher, markup_cache)
         self.dates = DateExtractionPipeline(regex_template.dates_regex)
         self.entities = EntityExtractionPipeline(self.elems_database, regex_template.entities_regexes)
         self.properties = PropertiesExtractionPipeline(self.elems_database)
+        # извлечение свойств удаляет токены из разметки и пока включается только явно
+        self.extract_properties = extract_properties
         self.rearrange = SentenceRearrangePipeline()
         self.direct_speech = DirectSpeechExtractionPipeline(regex_template.direct_speech_regexes)
         self.special_tokens = SpecialTokensPipeline()
 
-    def preprocess(self, text: str, index=0, now: Optional[PartialDateTime] = None) -> StoryEvent:
-        source_text = text
-        text = self.cleanup.cleanup(text)
-        block = self.markup.process(text)
-        block, dates = self.dates.process(block, now)
-        block, entities = self.entities.process(block)
-        # text, markups = self.properties.process(text, markups, entities)
+    def preprocess(self, text: str, index=0, now: Optional[PartialDateTime] = None,
+                   database: Optional[StoryElementsDatabase] = None) -> StoryEvent:
+        return self.preprocess_many([text], index, now, database)[0]
+
+    def preprocess_many(self, texts: List[str], start_index=0, now: Optional[PartialDateTime] = None,
+                        database: Optional[StoryElementsDatabase] = None) -> List[StoryEvent]:
+        """
+        Пакетный вариант preprocess: разметка и NER всех абзацев выполняются общими батчами,
+        а всё, что читает или меняет базу элементов, — по абзацам в исходном порядке, так что
+        абзац видит только элементы предыдущих абзацев, как при последовательных вызовах preprocess.
+        :param texts: Абзацы.
+        :param start_index: Индекс первого события.
+        :param now: Опорная дата для извлечения дат.
+        :param database: База элементов документа; по умолчанию — база препроцессора.
+        :return: События в порядке абзацев.
+        """
+        cleaned = [self.cleanup.cleanup(text) for text in texts]
+        blocks = self.markup.process_many(cleaned)
+        dated = [self.dates.process(block, now) for block in blocks]
+        database = database or self.elems_database
+        extracted = self.entities.extract_many([block for block, _ in dated])
+        events = []
+        for index, (source_text, (block, dates), block_entities) \
+                in enumerate(zip(texts, dated, extracted), start=start_index):
+            block, entities = self.entities.add_entities(block, block_entities, database)
+            events.append(self._finish_block(source_text, block, dates, entities, index, database))
+        return events
+
+    def _finish_block(self, source_text: str, block: EventMarkupBlock, dates: List[DateTimeToken],
+                      entities: Dict[str, Dict[int, uuid.UUID]], index: int,
+                      database: StoryElementsDatabase) -> StoryEvent:
+        database.datetimes.add_event(index, dates, entities)
+        if self.extract_properties:
+            _, block.markups = self.properties.process(str(block), block.markups, entities, database)
         block = self.special_tokens.process(block)
         block = self.rearrange.rearrange(block)
         # text = self.direct_speech.process(text)
@@ -24,7 +24,7 @@ class RussianScriptTemplate(RegexTemplate):
         super().__init__(**kwargs)
 
         self.cleanup_regexes = [
-            (r'^(?im)(ИНТ(?:ЕРЬЕР)?|ЭКСТ(?:ЕРЬЕР)?|ИНТ\.|ЭКСТ\.|НАТ(?:\s+НАТ\.)?)\s*[\s\-:]+.*$', ''),
+            (r'(?im)^(ИНТ(?:ЕРЬЕР)?|ЭКСТ(?:ЕРЬЕР)?|ИНТ\.|ЭКСТ\.|НАТ(?:\s+НАТ\.)?)\s*[\s\-:]+.*$', ''),
             (r'\s{2,}', ' '),
             (r',\s*,', ','),
             (r'\s*,\s*', ', '),
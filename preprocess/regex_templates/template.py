@@ -1,14 +1,28 @@
 from typing import List, Tuple, Dict, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 import re
 import csv
 
+from preprocess.modules.cleanup.program import CleanupProgram
+
 
 class RegexTemplate(BaseModel):
     cleanup_regexes: List[Tuple[str, str]] = Field(default_factory=list)
     dates_regex: Optional[str] = None
     entities_regexes: Dict[str, str] = Field(default_factory=dict)
     direct_speech_regexes: List[Tuple[str, bool, int]] = Field(default_factory=list)
+    _cleanup_program: Optional[CleanupProgram] = PrivateAttr(default=None)
+
+    @property
+    def cleanup_program(self) -> CleanupProgram:
+        """
+        cleanup_regexes, скомпилированные в программу очистки. Программа собирается один раз
+        и пересобирается, только если список правил изменился.
+        """
+        program = self._cleanup_program
+        if program is None or program.rules != tuple(tuple(rule) for rule in self.cleanup_regexes):
+            program = self._cleanup_program = CleanupProgram(self.cleanup_regexes)
+        return program
 
     def add_regex(self, pattern: str, replacement: str, index: Optional[int] = None) -> None:
         """
@@ -21,6 +35,7 @@ class RegexTemplate(BaseModel):
             self.cleanup_regexes.insert(index, (pattern, replacement))
         else:
             self.cleanup_regexes.append((pattern, replacement))
+        self._cleanup_program = None
 
     def load_stopwords_from_csv(self, csv_path: str, index: Optional[int] = None) -> None:
         """
@@ -6,13 +6,15 @@ import traceback
 from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 from uuid import UUID
 import re
 
 import nltk
 from pydantic import BaseModel
 
+from preprocess.models.registry import ModelRegistry
+from preprocess.modules.markup.cache import MarkupCache
 from preprocess.preprocessor import EventPreprocessor
 from preprocess.regex_templates.literary_prose import LiteraryProseTemplate
 from story_elements.database import StoryElementsDatabase
@@ -25,6 +27,8 @@ logger = logging.getLogger(__name__)
 
 ERROR_LOG_FILE = "failed_files.txt"
 PROCESSED_LOG_FILE = "processed_files.txt"
+# сколько абзацев размечается одним пакетом моделей
+PARAGRAPHS_PER_BATCH = 32
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -109,15 +113,22 @@ def split_paragraphs(text: str, max_words: int = 100) -> List[str]:
     return paragraphs
 
 
-def process_file(file_path: str, output_dir: str) -> None:
+def process_file(file_path: str, output_dir: str, markup_cache_path: Optional[str] = None,
+                 elements_dir: Optional[str] = None) -> None:
+    db = None
+    markup_cache = None
     try:
         if Path(output_dir, f"{Path(file_path).stem}_processed.json").exists():
             logger.info(f"Файл уже обработан: {file_path}")
             return
 
         logger.info(f"Начата обработка файла: {file_path}")
-        db = StoryElementsDatabase()
-        preprocessor = EventPreprocessor(LiteraryProseTemplate(), db)
+        # у каждого файла своя база элементов; с elements_dir она хранится в SQLite рядом с результатами
+        db_path = str(Path(elements_dir) / f"{Path(file_path).stem}.sqlite") if elements_dir else None
+        db = StoryElementsDatabase(db_path)
+        if markup_cache_path:
+            markup_cache = MarkupCache(markup_cache_path, ModelRegistry.markup_version())
+        preprocessor = EventPreprocessor(LiteraryProseTemplate(), db, markup_cache=markup_cache)
 
         with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
             text = f.read()
@@ -126,14 +137,17 @@ def process_file(file_path: str, output_dir: str) -> None:
         logger.info(f"Параграфы разделены: {file_path} {len(paragraphs)}")
 
         events = []
-        index = 0
 
-        for para in paragraphs:
-            logger.info(f"Параграф {index} начинает обработку: {para}")
-            event = preprocessor.preprocess(para, index=index)
-            logger.info(f"Параграф {index} обработан: {file_path}")
-            events.append(event)
-            index += 1
+        for index in range(0, len(paragraphs), PARAGRAPHS_PER_BATCH):
+            batch = paragraphs[index:index + PARAGRAPHS_PER_BATCH]
+            logger.info(f"Параграфы {index}-{index + len(batch) - 1} начинают обработку: {file_path}")
+            events.extend(preprocessor.preprocess_many(batch, start_index=index))
+            logger.info(f"Параграфы {index}-{index + len(batch) - 1} обработаны: {file_path}")
+
+        # после слияний union-find события могут ссылаться на поглощённые элементы:
+        # в выдачу пишутся id каноничных, которые есть в story_elements
+        for event in events:
+            event.elements = db.resolve_elements(event.elements)
 
         story_elements = {
             'PER': [elem.model_dump() for elem in db.characters.elements],
@@ -143,7 +157,9 @@ def process_file(file_path: str, output_dir: str) -> None:
 
         result = {
             'events': [event.model_dump() for event in events],
-            'story_elements': story_elements
+            'story_elements': story_elements,
+            # хронология сохраняется и без --elements-dir, когда база живёт только в памяти
+            'timeline': [entry.to_dict() for entry in db.datetimes.entries]
         }
 
         output_path = Path(output_dir) / f"{Path(file_path).stem}_processed.json"
@@ -156,10 +172,19 @@ def process_file(file_path: str, output_dir: str) -> None:
     except Exception as e:
         logger.error(f"Ошибка при обработке файла {file_path}:\n{traceback.format_exc()}")
         log_failed_file(file_path, e)
+    finally:
+        # соединения SQLite закрываются и при ошибке, иначе воркер копит открытые WAL
+        if db is not None:
+            db.close()
+        if markup_cache is not None:
+            markup_cache.close()
 
 
-def process_all_files(input_dir: str = "../data", output_dir: str = "../data_preprocessed", resume: bool = False):
+def process_all_files(input_dir: str = "../data", output_dir: str = "../data_preprocessed", resume: bool = False,
+                      markup_cache_path: Optional[str] = None, elements_dir: Optional[str] = None):
     Path(output_dir).mkdir(parents=True, exist_ok=True)
+    if elements_dir:
+        Path(elements_dir).mkdir(parents=True, exist_ok=True)
 
     file_paths = collect_txt_files(input_dir)
 
@@ -170,8 +195,11 @@ def process_all_files(input_dir: str = "../data", output_dir: str = "../data_pre
 
     logger.info(f"Найдено {len(file_paths)} файлов для обработки.")
 
+    # модели загружаются один раз в родительском процессе и достаются воркерам через fork
+    ModelRegistry.preload()
+
     with multiprocessing.Pool() as pool:
-        pool.starmap(process_file, [(file_path, output_dir) for file_path in file_paths])
+        pool.starmap(process_file, [(file_path, output_dir, markup_cache_path, elements_dir) for file_path in file_paths])
 
     logger.info("Обработка всех файлов завершена.")
 
@@ -181,6 +209,9 @@ if __name__ == '__main__':
     parser.add_argument('--input', default='../data', help='Входная директория')
     parser.add_argument('--output', default='../data_preprocessed', help='Выходная директория')
     parser.add_argument('--resume', action='store_true', help='Продолжить с места остановки')
+    parser.add_argument('--markup-cache', default=None, help='Файл кэша разметки предложений (SQLite)')
+    parser.add_argument('--elements-dir', default=None, help='Директория для баз элементов истории (SQLite)')
     args = parser.parse_args()
 
-    process_all_files(input_dir=args.input, output_dir=args.output, resume=args.resume)
+    process_all_files(input_dir=args.input, output_dir=args.output, resume=args.resume,
+                      markup_cache_path=args.markup_cache, elements_dir=args.elements_dir)
@@ -43,8 +43,7 @@ if __name__ == '__main__':
         icecream.ic(f"{d} {key} {d}")
         for text in texts:
             database = StoryElementsDatabase()
-            preprocessor.database = database
-            result = preprocessor.preprocess(text)
+            result = preprocessor.preprocess(text, database=database)
             icecream.ic(result.model_dump())
             if "PER" in result.elements:
                 for elem_id in result.elements["PER"].values():
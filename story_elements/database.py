@@ -1,31 +1,71 @@
+import threading
+import uuid
+from typing import Dict, Optional
+
 from story_elements.repositories.characters import CharacterRepository
 from story_elements.repositories.datetimes import DatetimeRepository
 from story_elements.repositories.locations import LocationRepository
 from story_elements.repositories.organizations import OrganizationRepository
+from story_elements.repositories.sqlite import SQLiteStorage, SQLiteStoryElementRepository
 
 
 class StoryElementsDatabase:
-    _instance = None
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(StoryElementsDatabase, cls).__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
+    """
+    База элементов истории одного документа или корпуса. Экземпляры независимы:
+    каждый документ (или группа документов с общими персонажами) получает свою базу.
+    """
 
-    def __init__(self):
-        if not self._initialized:
+    def __init__(self, path: Optional[str] = None):
+        """
+        :param path: Файл SQLite для хранения персонажей, локаций и организаций;
+            без него элементы хранятся в памяти процесса.
+        """
+        self.storage: Optional[SQLiteStorage] = None
+        if path is None:
             self.repositories = {
                 'PER': CharacterRepository(),
                 'LOC': LocationRepository(),
                 'ORG': OrganizationRepository()
             }
-            self.datetimes = DatetimeRepository()
-            self._initialized = True
+        else:
+            self.storage = SQLiteStorage(path)
+            self.repositories = {
+                t_type: SQLiteStoryElementRepository(self.storage, t_type)
+                for t_type in ('PER', 'LOC', 'ORG')
+            }
+        # хронология дат событий хранится вместе с остальными элементами
+        self.datetimes = DatetimeRepository(self.storage, self.resolve)
+
+    def resolve(self, elem_id: uuid.UUID) -> Optional[uuid.UUID]:
+        """
+        id каноничного элемента любого типа, в который слит elem_id.
+        :return: id каноничного элемента или None, если id неизвестен.
+        """
+        for repository in self.repositories.values():
+            root = repository.resolve(elem_id)
+            if root is not None:
+                return root
+        return None
+
+    def resolve_elements(self, elements: Dict[str, Dict[int, uuid.UUID]]) -> Dict[str, Dict[int, uuid.UUID]]:
+        """
+        Переводит элементы события (как в StoryEvent.elements) в id каноничных элементов:
+        элемент, поглощённый при слиянии после обработки события, заменяется тем, в который он слит.
+        :param elements: Тип -> индекс спецтокена -> id элемента.
+        :return: Те же элементы с каноничными id; неизвестные id остаются как есть.
+        """
+        resolved: Dict[str, Dict[int, uuid.UUID]] = {}
+        for t_type, by_index in elements.items():
+            repository = self.repositories.get(t_type)
+            resolved[t_type] = {
+                index: (repository.resolve(elem_id) if repository is not None else None) or elem_id
+                for index, elem_id in by_index.items()
+            }
+        return resolved
 
-    @classmethod
-    def reset_instance(cls):
-        cls._instance = None
+    def close(self):
+        if self.storage is not None:
+            self.storage.close()
 
     @property
     def characters(self):
@@ -38,3 +78,17 @@ class StoryElementsDatabase:
     @property
     def organizations(self):
         return self.repositories['ORG']
+
+
+class ThreadSafeStoryElementsDatabase(StoryElementsDatabase):
+    """
+    База, которую можно разделять между потоками: все репозитории работают под одной
+    блокировкой, так что добавление пакета элементов в любой репозиторий атомарно.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        super().__init__(path)
+        self.lock = threading.RLock()
+        for repository in self.repositories.values():
+            repository.lock = self.lock
+        self.datetimes.lock = self.lock
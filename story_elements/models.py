@@ -1,6 +1,6 @@
 import json
 from enum import Enum, auto
-from typing import List, Optional
+from typing import List, Optional, Set
 from pydantic import BaseModel, Field
 from hors.partial_date.partial_datetime import PartialDateTime
 import uuid
@@ -74,3 +74,92 @@ class Location(StoryElement):
 
 class Organization(StoryElement):
     type: str = "ORG"
+
+
+class StoryElementRecord:
+    """
+    Внутреннее представление элемента истории в репозиториях: без валидации pydantic,
+    с множествами имён и свойств и слиянием на месте. В StoryElement переводится
+    только при сериализации.
+    """
+    __slots__ = ('id', 'name', 'type', 'associated_names', 'birth_date', 'last_date', 'properties',
+                 'extraction_origin')
+
+    def __init__(self,
+                 name: str,
+                 type: str,
+                 id: Optional[uuid.UUID] = None,
+                 associated_names: Optional[Set[str]] = None,
+                 birth_date: Optional[PartialDateTime] = None,
+                 last_date: Optional[PartialDateTime] = None,
+                 properties: Optional[Set[str]] = None,
+                 extraction_origin: Optional[StoryElementExtractionOrigin] = None):
+        self.id = id or uuid.uuid4()
+        self.name = name
+        self.type = type
+        self.associated_names: Set[str] = set(associated_names or ())
+        self.birth_date = birth_date
+        self.last_date = last_date
+        self.properties: Set[str] = set(properties or ())
+        self.extraction_origin = extraction_origin
+
+    @classmethod
+    def from_model(cls, element: 'StoryElement') -> 'StoryElementRecord':
+        return cls(
+            name=element.name,
+            type=element.type,
+            id=element.id,
+            associated_names=set(element.associated_names),
+            birth_date=element.birth_date,
+            last_date=element.last_date,
+            properties=set(element.properties),
+            extraction_origin=element.extraction_origin,
+        )
+
+    def to_model(self) -> StoryElement:
+        model = STORY_ELEMENT_MODELS.get(self.type, StoryElement)
+        return model(
+            id=self.id,
+            name=self.name,
+            type=self.type,
+            associated_names=sorted(self.associated_names),
+            birth_date=self.birth_date,
+            last_date=self.last_date,
+            properties=sorted(self.properties),
+            extraction_origin=self.extraction_origin,
+        )
+
+    def model_dump(self, **kwargs) -> dict:
+        return self.to_model().model_dump(**kwargs)
+
+    def merge(self, other: 'StoryElementRecord') -> 'StoryElementRecord':
+        """
+        Сливает other в этот элемент на месте (как StoryElement.merge).
+        :return: Этот элемент.
+        """
+        self.associated_names.add(self.name)
+        self.associated_names.add(other.name)
+        self.associated_names |= other.associated_names
+        self.associated_names.update(other.name.strip().split(' '))
+        self.properties |= other.properties
+
+        if self.birth_date is None:
+            self.birth_date = other.birth_date
+        elif other.birth_date is not None:
+            self.birth_date = self.birth_date.merge(other.birth_date)
+
+        if self.last_date is None:
+            self.last_date = other.last_date
+        elif other.last_date is not None:
+            self.last_date = self.last_date.merge(other.last_date)
+        return self
+
+    def __repr__(self) -> str:
+        return f"StoryElementRecord(id={self.id}, name={self.name!r}, type={self.type})"
+
+
+STORY_ELEMENT_MODELS = {
+    'PER': Character,
+    'LOC': Location,
+    'ORG': Organization,
+}
@@ -1,31 +1,59 @@
+import threading
 import uuid
-from typing import Generic, TypeVar, List, Optional, Dict
+from contextlib import nullcontext
+from typing import Generic, TypeVar, List, Optional, Dict, Iterator, ContextManager, Union
 
 from icecream import icecream
 
-from story_elements.models import StoryElement
+from story_elements.models import StoryElement, StoryElementRecord
 
 T = TypeVar("T", bound=StoryElement)
 
 
 class BaseStoryElementRepository(Generic[T]):
+    """
+    Хранилище элементов истории. Элементы с общими именами объединяются через систему
+    непересекающихся множеств (union-find) по id: имя может связать два уже существующих
+    элемента, и тогда они сливаются в каноничный — самый ранний из них. id поглощённых
+    элементов продолжают разрешаться в каноничный элемент.
+    Принимает StoryElement или StoryElementRecord, хранит и возвращает StoryElementRecord.
+    """
+
     def __init__(self):
-        self.elements: List[T] = []
         self.special_token_head: str = ''
+        # блокировка для потокобезопасных баз; без неё репозиторий используется из одного потока
+        self.lock: Optional[threading.RLock] = None
+        # каноничные элементы в порядке появления
+        self._elements: Dict[uuid.UUID, StoryElementRecord] = {}
+        # родитель id в union-find; у каноничного элемента родитель — он сам
+        self._parents: Dict[uuid.UUID, uuid.UUID] = {}
+        # порядковый номер появления каноничного элемента
+        self._order: Dict[uuid.UUID, int] = {}
+        # имя/ассоциированное имя -> id одного из элементов множества
+        self._ids_by_name: Dict[str, uuid.UUID] = {}
+
+    @property
+    def elements(self) -> List[StoryElementRecord]:
+        with self._locked():
+            return list(self._iter_elements())
 
-    def add(self, element: T, current_index: int = 1) -> str:
-        self._insert_or_update(element)
+    def add(self, element: Union[T, StoryElementRecord], current_index: int = 1) -> str:
+        with self._locked(), self._transaction():
+            self._insert_or_update(element)
         return f"<|{self.special_token_head}_{current_index + 1}|>"
 
-    def add_elements(self, elements: Dict[int, T]) -> (List[int], Dict[int, uuid.UUID]):
+    def add_elements(self, elements: Dict[int, Union[T, StoryElementRecord]]) -> (List[int], Dict[int, uuid.UUID]):
+        with self._locked(), self._transaction():
+            # сначала добавляем все элементы: следующий элемент пакета может объединить предыдущие
+            inserted_ids = [self._insert_or_update(element) for element in elements.values()]
+            final_ids = [self._resolve(inserted_id) for inserted_id in inserted_ids]
+
         new_indexes = []
         id_mapping = {}
         id_mapped = {}
         next_index = 1
 
-        for original_index, element in elements.items():
-            final_id = self._insert_or_update(element)
-
+        for final_id in final_ids:
             if final_id not in id_mapping:
                 id_mapping[final_id] = next_index
                 next_index += 1
@@ -33,24 +61,138 @@ class BaseStoryElementRepository(Generic[T]):
             id_mapped[id_mapping[final_id]] = final_id
         return new_indexes, id_mapped
 
-    def find_by_text(self, text: str) -> Optional[T]:
-        for element in self.elements:
-            if text == element.name or text in element.associated_names:
-                return element
-        return None
-
-    def find_by_id(self, elem_id: uuid.UUID) -> Optional[T]:
-        for element in self.elements:
-            if element.id == elem_id:
-                return element
-
-    def _insert_or_update(self, element: T):
-        for i, existing in enumerate(self.elements):
-            if element == existing:
-                merged = existing.merge(element)
-                self.elements[i] = merged
-                return merged.id
-
-        element.associated_names = element.name.strip().split(' ')
-        self.elements.append(element)
-        return element.id
+    def resolve(self, elem_id: uuid.UUID) -> Optional[uuid.UUID]:
+        """
+        Возвращает id каноничного элемента, в который слит элемент elem_id.
+        :param elem_id: id элемента, возможно уже поглощённого.
+        :return: id каноничного элемента или None, если id неизвестен.
+        """
+        # сжатие путей в _resolve пишет в хранилище, поэтому чтение тоже идёт в транзакции
+        with self._locked(), self._transaction():
+            return self._resolve(elem_id)
+
+    def find_by_text(self, text: str) -> Optional[StoryElementRecord]:
+        with self._locked(), self._transaction():
+            elem_id = self._get_name(text)
+            if elem_id is None:
+                return None
+            return self._get_element(self._resolve(elem_id))
+
+    def find_by_id(self, elem_id: uuid.UUID) -> Optional[StoryElementRecord]:
+        with self._locked(), self._transaction():
+            root = self._resolve(elem_id)
+            if root is None:
+                return None
+            return self._get_element(root)
+
+    def _locked(self) -> ContextManager:
+        return self.lock if self.lock is not None else nullcontext()
+
+    def _resolve(self, elem_id: uuid.UUID) -> Optional[uuid.UUID]:
+        parent = self._get_parent(elem_id)
+        if parent is None:
+            return None
+        path = []
+        root = elem_id
+        while parent != root:
+            path.append(root)
+            root = parent
+            parent = self._get_parent(root)
+        # сжатие путей
+        for node in path[:-1]:
+            self._set_parent(node, root)
+        return root
+
+    def _insert_or_update(self, element: Union[T, StoryElementRecord]):
+        # внутри репозитория элементы хранятся как StoryElementRecord и сливаются на месте
+        if not isinstance(element, StoryElementRecord):
+            element = StoryElementRecord.from_model(element)
+        own_root = self._resolve(element.id)
+        roots = {own_root} - {None}
+        # имена и ассоциированные имена связывают элемент с известными; части имени нового
+        # элемента — только с однословными элементами: «Анна Сергеевна» объединяет «Анну»
+        # и «Сергеевну», но не «Анну Павловну»
+        multi_word = self._is_multi_word(element)
+        parts = set(element.name.strip().split(' ')) - self._names(element) if multi_word else set()
+        for name in self._names(element) | parts:
+            elem_id = self._get_name(name)
+            root = None if elem_id is None else self._resolve(elem_id)
+            if root is None or root in roots:
+                continue
+            if name in parts and self._is_multi_word(self._get_element(root)):
+                continue
+            roots.add(root)
+        # два элемента с многословными именами не объединяются: остаётся собственный
+        # элемент, если он уже есть, иначе самый ранний
+        multi_word_roots = sorted(
+            (root for root in roots if self._is_multi_word(self._get_element(root))),
+            key=lambda root: (root != own_root, self._get_order(root))
+        )
+        roots.difference_update(multi_word_roots[1:])
+
+        if not roots:
+            element.associated_names = set(element.name.strip().split(' '))
+            self._set_parent(element.id, element.id)
+            self._put_element(element.id, element, new=True)
+            self._index(element, element.id)
+            return element.id
+
+        # все найденные множества сливаются в самое раннее
+        root, *others = sorted(roots, key=self._get_order)
+        merged = self._get_element(root)
+        for other in others:
+            merged = merged.merge(self._pop_element(other))
+            self._set_parent(other, root)
+        merged = merged.merge(element)
+        if self._get_parent(element.id) is None:
+            self._set_parent(element.id, root)
+        self._put_element(root, merged, new=False)
+        self._index(merged, root)
+        return root
+
+    def _index(self, element: StoryElementRecord, root: uuid.UUID):
+        for name in self._names(element):
+            self._add_name(name, root)
+
+    @staticmethod
+    def _names(element: StoryElementRecord) -> set:
+        return element.associated_names | {element.name}
+
+    @classmethod
+    def _is_multi_word(cls, element: StoryElementRecord) -> bool:
+        return any(' ' in name.strip() for name in cls._names(element))
+
+    # хранение: элементы, union-find и индекс имён в памяти процесса;
+    # другие хранилища переопределяют эти методы
+
+    def _transaction(self) -> ContextManager:
+        return nullcontext()
+
+    def _get_parent(self, elem_id: uuid.UUID) -> Optional[uuid.UUID]:
+        return self._parents.get(elem_id)
+
+    def _set_parent(self, elem_id: uuid.UUID, parent: uuid.UUID):
+        self._parents[elem_id] = parent
+
+    def _get_order(self, root: uuid.UUID) -> int:
+        return self._order[root]
+
+    def _get_element(self, root: uuid.UUID) -> StoryElementRecord:
+        return self._elements[root]
+
+    def _put_element(self, root: uuid.UUID, element: StoryElementRecord, new: bool):
+        if new:
+            self._order[root] = len(self._order)
+        self._elements[root] = element
+
+    def _pop_element(self, root: uuid.UUID) -> StoryElementRecord:
+        return self._elements.pop(root)
+
+    def _iter_elements(self) -> Iterator[StoryElementRecord]:
+        return iter(self._elements.values())
+
+    def _get_name(self, name: str) -> Optional[uuid.UUID]:
+        return self._ids_by_name.get(name)
+
+    def _add_name(self, name: str, root: uuid.UUID):
+        self._ids_by_name.setdefault(name, root)
@@ -1,9 +1,252 @@
+import calendar
+import datetime
+import threading
+import uuid
+from bisect import bisect_right
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union, ContextManager
+
+from hors.models.parser_models import DateTimeToken
 from hors.partial_date.partial_datetime import PartialDateTime
 
-from story_elements.repositories.base import BaseStoryElementRepository
+from story_elements.repositories.sqlite import SQLiteStorage
+
+DateBound = Union[datetime.datetime, PartialDateTime]
+
+
+class TimelineEntry:
+    __slots__ = ('start', 'end', 'event_index')
+
+    def __init__(self, start: datetime.datetime, end: datetime.datetime, event_index: int):
+        self.start = start
+        self.end = end
+        self.event_index = event_index
+
+    def to_dict(self) -> Dict[str, Union[int, str]]:
+        return {'event_index': self.event_index, 'start': self.start.isoformat(), 'end': self.end.isoformat()}
 
+    def __repr__(self) -> str:
+        return f"TimelineEntry(start={self.start}, end={self.end}, event_index={self.event_index})"
 
-class DatetimeRepository(BaseStoryElementRepository[PartialDateTime]):
-    def __init__(self):
-        super().__init__()
+
+class DatetimeRepository:
+    """
+    Хронология событий: интервалы дат из StoryEvent.dates, отсортированные по началу,
+    с деревом отрезков максимальных концов над ними. Запрос диапазона отсекает бинарным поиском
+    интервалы, начинающиеся позже end, и спускается по дереву только в поддеревья, где есть
+    интервал с концом не раньше start: O(log n + k) независимо от длины интервалов.
+    Новые интервалы копятся отдельно и вливаются в индекс одной сортировкой при следующем чтении.
+    Даты без года в хронологию не попадают. id элементов хранятся такими, какими их выдало
+    событие, и при запросе разрешаются в каноничные.
+    """
+
+    def __init__(self, storage: Optional[SQLiteStorage] = None,
+                 resolve: Optional[Callable[[uuid.UUID], Optional[uuid.UUID]]] = None):
+        """
+        :param storage: Хранилище SQLite базы элементов; без него хронология хранится в памяти.
+        :param resolve: Перевод id элемента в id каноничного элемента после слияний.
+        """
         self.special_token = 'DATETIME'
+        self.lock: Optional[threading.RLock] = None
+        self.storage = storage
+        self.resolve = resolve
+        self._starts: List[datetime.datetime] = []
+        self._entries: List[TimelineEntry] = []
+        # дерево отрезков: _max_end[node] — наибольший конец интервала в поддереве, листья с _size
+        self._max_end: List[datetime.datetime] = []
+        self._size = 0
+        # добавленные, но ещё не влитые в индекс интервалы
+        self._pending: List[TimelineEntry] = []
+        # (event_index, начало, конец) уже добавленных интервалов: повторная обработка их не дублирует
+        self._keys: Set[Tuple[int, datetime.datetime, datetime.datetime]] = set()
+        self._elements: Dict[int, Set[uuid.UUID]] = {}
+        if storage is not None:
+            self._create_tables()
+            self._load()
+
+    def add_event(self,
+                  event_index: int,
+                  dates: Iterable[Union[DateTimeToken, PartialDateTime]],
+                  elements: Optional[Dict[str, Dict[int, uuid.UUID]]] = None):
+        """
+        Добавляет даты события в хронологию.
+        :param event_index: Индекс события.
+        :param dates: Даты события (DateTimeToken из hors или PartialDateTime).
+        :param elements: Элементы события по типам, как в StoryEvent.elements.
+        """
+        bounds = [b for b in (self.bounds(date) for date in dates) if b is not None]
+        element_ids = {eid for by_index in (elements or {}).values() for eid in by_index.values()}
+        if not bounds:
+            return
+        with self._locked():
+            for start, end in bounds:
+                self._insert(TimelineEntry(start, end, event_index))
+            self._elements.setdefault(event_index, set()).update(element_ids)
+            if self.storage is not None:
+                with self.storage.transaction():
+                    self.storage.connection.executemany(
+                        "INSERT OR IGNORE INTO timeline (event_index, start, stop) VALUES (?, ?, ?)",
+                        [(event_index, start.isoformat(), end.isoformat()) for start, end in bounds]
+                    )
+                    self.storage.connection.executemany(
+                        "INSERT OR IGNORE INTO timeline_elements (event_index, element_id) VALUES (?, ?)",
+                        [(event_index, str(eid)) for eid in element_ids]
+                    )
+
+    def query(self, start: DateBound, end: DateBound) -> List[TimelineEntry]:
+        """
+        Интервалы, пересекающиеся с диапазоном [start, end], в порядке начала.
+        Частичные даты берутся по самым широким границам: query(1812, 1812) — весь 1812 год.
+        """
+        start = self._lower(start)
+        end = self._upper(end)
+        with self._locked():
+            self._build_index()
+            hi = bisect_right(self._starts, end)
+            result: List[TimelineEntry] = []
+            # обход слева направо: правый ребёнок кладётся в стек раньше левого
+            stack = [(1, 0, self._size)]
+            while stack:
+                node, lo, size = stack.pop()
+                if lo >= hi or self._max_end[node] < start:
+                    continue
+                if size == 1:
+                    result.append(self._entries[lo])
+                    continue
+                half = size // 2
+                stack.append((2 * node + 1, lo + half, half))
+                stack.append((2 * node, lo, half))
+            return result
+
+    def events_between(self, start: DateBound, end: DateBound) -> List[int]:
+        return sorted({entry.event_index for entry in self.query(start, end)})
+
+    def elements_between(self, start: DateBound, end: DateBound) -> Set[uuid.UUID]:
+        result: Set[uuid.UUID] = set()
+        with self._locked():
+            for event_index in self.events_between(start, end):
+                result |= self._elements.get(event_index, set())
+            if self.resolve is not None:
+                # поглощённые после события элементы заменяются каноничными
+                result = {self.resolve(elem_id) or elem_id for elem_id in result}
+        return result
+
+    @property
+    def entries(self) -> List[TimelineEntry]:
+        """
+        Все интервалы хронологии в порядке начала.
+        """
+        with self._locked():
+            self._build_index()
+            return list(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self._pending)
+
+    @classmethod
+    def bounds(cls, date: Union[DateTimeToken, PartialDateTime]) \
+            -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+        """
+        Границы интервала даты: для DateTimeToken — от начала date_from до конца date_to,
+        для PartialDateTime — самый широкий интервал, совместимый с известными полями.
+        :return: (начало, конец) или None, если год неизвестен или дата некорректна.
+        """
+        date_from = getattr(date, 'date_from', date)
+        date_to = getattr(date, 'date_to', date)
+        try:
+            start = cls._lower(date_from)
+        except (TypeError, ValueError, OverflowError, AttributeError):
+            return None
+        try:
+            end = cls._upper(date_to)
+        except (TypeError, ValueError, OverflowError, AttributeError):
+            end = cls._upper(date_from)
+        if end < start:
+            start, end = end, start
+        return start, end
+
+    @staticmethod
+    def _lower(date: DateBound) -> datetime.datetime:
+        if isinstance(date, datetime.datetime):
+            return date
+        if date.year is None:
+            raise ValueError("Год даты неизвестен")
+        return datetime.datetime(
+            date.year, date.month or 1, date.day or 1,
+            date.hour or 0, date.minute or 0, date.second or 0, date.microsecond or 0
+        ) + (date.relative_offset or datetime.timedelta(0))
+
+    @staticmethod
+    def _upper(date: DateBound) -> datetime.datetime:
+        if isinstance(date, datetime.datetime):
+            return date
+        if date.year is None:
+            raise ValueError("Год даты неизвестен")
+        month = date.month or 12
+        day = date.day or calendar.monthrange(date.year, month)[1]
+        return datetime.datetime(
+            date.year, month, day,
+            23 if date.hour is None else date.hour,
+            59 if date.minute is None else date.minute,
+            59 if date.second is None else date.second,
+            999999 if date.microsecond is None else date.microsecond
+        ) + (date.relative_offset or datetime.timedelta(0))
+
+    def _insert(self, entry: TimelineEntry):
+        key = (entry.event_index, entry.start, entry.end)
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        self._pending.append(entry)
+
+    def _build_index(self):
+        """
+        Вливает накопленные интервалы в отсортированный список и перестраивает дерево отрезков.
+        Сортировка устойчива: интервалы с одним началом остаются в порядке добавления.
+        """
+        if not self._pending:
+            return
+        self._entries.extend(self._pending)
+        self._pending = []
+        self._entries.sort(key=lambda entry: entry.start)
+        self._starts = [entry.start for entry in self._entries]
+
+        size = 1
+        while size < len(self._entries):
+            size *= 2
+        max_end = [datetime.datetime.min] * (2 * size)
+        max_end[size:size + len(self._entries)] = [entry.end for entry in self._entries]
+        for node in range(size - 1, 0, -1):
+            max_end[node] = max(max_end[2 * node], max_end[2 * node + 1])
+        self._size = size
+        self._max_end = max_end
+
+    def _locked(self) -> ContextManager:
+        return self.lock if self.lock is not None else nullcontext()
+
+    def _create_tables(self):
+        self.storage.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS timeline (
+                event_index INTEGER NOT NULL,
+                start TEXT NOT NULL,
+                stop TEXT NOT NULL,
+                UNIQUE (event_index, start, stop)
+            );
+            CREATE INDEX IF NOT EXISTS timeline_start ON timeline (start);
+            CREATE TABLE IF NOT EXISTS timeline_elements (
+                event_index INTEGER NOT NULL,
+                element_id TEXT NOT NULL,
+                PRIMARY KEY (event_index, element_id)
+            );
+        """)
+
+    def _load(self):
+        connection = self.storage.connection
+        for event_index, start, stop in connection.execute(
+                "SELECT event_index, start, stop FROM timeline ORDER BY start"):
+            self._insert(TimelineEntry(
+                datetime.datetime.fromisoformat(start), datetime.datetime.fromisoformat(stop), event_index
+            ))
+        for event_index, element_id in connection.execute(
+                "SELECT event_index, element_id FROM timeline_elements"):
+            self._elements.setdefault(event_index, set()).add(uuid.UUID(element_id))
@@ -0,0 +1,216 @@
+import datetime
+import json
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple, TypeVar
+
+from hors.partial_date.partial_datetime import PartialDateTime
+
+from story_elements.models import StoryElement, StoryElementExtractionOrigin, StoryElementRecord
+from story_elements.repositories.base import BaseStoryElementRepository
+
+T = TypeVar("T", bound=StoryElement)
+
+_COLUMNS = "id, type, name, associated_names, properties, birth_date, last_date, extraction_origin"
+
+
+class SQLiteStorage:
+    """
+    Файл SQLite с элементами истории, общий для репозиториев всех типов одной базы.
+    Поля элементов хранятся в колонках (множества имён и свойств и даты — в JSON), индекс имён
+    и перенаправления union-find — в отдельных индексированных таблицах, чтобы их можно было
+    запрашивать без загрузки всей базы.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Путь к файлу базы.
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self._depth = 0
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS elements (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                associated_names TEXT NOT NULL,
+                properties TEXT NOT NULL,
+                birth_date TEXT,
+                last_date TEXT,
+                extraction_origin TEXT
+            );
+            CREATE INDEX IF NOT EXISTS elements_type_seq ON elements (type, seq);
+            CREATE INDEX IF NOT EXISTS elements_name ON elements (name);
+            CREATE TABLE IF NOT EXISTS names (
+                type TEXT NOT NULL,
+                name TEXT NOT NULL,
+                id TEXT NOT NULL,
+                PRIMARY KEY (type, name)
+            );
+            CREATE INDEX IF NOT EXISTS names_id ON names (id);
+            CREATE TABLE IF NOT EXISTS redirects (
+                id TEXT PRIMARY KEY,
+                type TEXT NOT NULL,
+                parent TEXT NOT NULL
+            );
+        """)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(elements)")}
+        if 'associated_names' not in columns:
+            self.connection.close()
+            raise ValueError(f"База {path} создана в старом формате, её нужно пересоздать")
+
+    @contextmanager
+    def transaction(self):
+        # вложенные транзакции сворачиваются во внешнюю
+        if self._depth == 0:
+            self.connection.execute("BEGIN")
+        self._depth += 1
+        try:
+            yield
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.execute("ROLLBACK")
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self.connection.execute("COMMIT")
+
+    def close(self):
+        self.connection.close()
+
+
+class SQLiteStoryElementRepository(BaseStoryElementRepository[T]):
+    """
+    Репозиторий элементов истории, хранящий элементы, индекс имён и перенаправления
+    в SQLite. Логика слияния та же, что у BaseStoryElementRepository.
+    """
+
+    def __init__(self, storage: SQLiteStorage, element_type: str):
+        """
+        :param storage: Общее хранилище базы.
+        :param element_type: Тип элементов репозитория (PER, LOC, ORG).
+        """
+        super().__init__()
+        self.storage = storage
+        self.special_token = element_type
+        self.element_type = element_type
+        row = self._execute("SELECT MAX(seq) FROM elements WHERE type = ?", (element_type,)).fetchone()
+        self._next_seq = 0 if row[0] is None else row[0] + 1
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        return self.storage.connection.execute(sql, params)
+
+    def _transaction(self):
+        return self.storage.transaction()
+
+    def _get_parent(self, elem_id: uuid.UUID) -> Optional[uuid.UUID]:
+        row = self._execute("SELECT parent FROM redirects WHERE id = ?", (str(elem_id),)).fetchone()
+        return None if row is None else uuid.UUID(row[0])
+
+    def _set_parent(self, elem_id: uuid.UUID, parent: uuid.UUID):
+        self._execute(
+            "INSERT OR REPLACE INTO redirects (id, type, parent) VALUES (?, ?, ?)",
+            (str(elem_id), self.element_type, str(parent))
+        )
+
+    def _get_order(self, root: uuid.UUID) -> int:
+        return self._execute("SELECT seq FROM elements WHERE id = ?", (str(root),)).fetchone()[0]
+
+    def _get_element(self, root: uuid.UUID) -> StoryElementRecord:
+        row = self._execute(f"SELECT {_COLUMNS} FROM elements WHERE id = ?", (str(root),)).fetchone()
+        return _record(row)
+
+    def _put_element(self, root: uuid.UUID, element: StoryElementRecord, new: bool):
+        values = _values(element)
+        if new:
+            self._execute(
+                f"INSERT INTO elements (seq, {_COLUMNS}) VALUES (?, {', '.join('?' * len(values))})",
+                (self._next_seq, *values)
+            )
+            self._next_seq += 1
+        else:
+            self._execute(
+                "UPDATE elements SET name = ?, associated_names = ?, properties = ?, birth_date = ?, "
+                "last_date = ?, extraction_origin = ? WHERE id = ?",
+                # id и тип элемента не меняются
+                (*values[2:], str(root))
+            )
+
+    def _pop_element(self, root: uuid.UUID) -> StoryElementRecord:
+        element = self._get_element(root)
+        self._execute("DELETE FROM elements WHERE id = ?", (str(root),))
+        return element
+
+    def _iter_elements(self) -> Iterator[StoryElementRecord]:
+        cursor = self._execute(
+            f"SELECT {_COLUMNS} FROM elements WHERE type = ? ORDER BY seq", (self.element_type,)
+        )
+        for row in cursor:
+            yield _record(row)
+
+    def _get_name(self, name: str) -> Optional[uuid.UUID]:
+        row = self._execute(
+            "SELECT id FROM names WHERE type = ? AND name = ?", (self.element_type, name)
+        ).fetchone()
+        return None if row is None else uuid.UUID(row[0])
+
+    def _add_name(self, name: str, root: uuid.UUID):
+        self._execute(
+            "INSERT OR IGNORE INTO names (type, name, id) VALUES (?, ?, ?)",
+            (self.element_type, name, str(root))
+        )
+
+
+def _values(element: StoryElementRecord) -> Tuple:
+    """
+    Значения колонок элемента в порядке _COLUMNS.
+    """
+    return (
+        str(element.id),
+        element.type,
+        element.name,
+        json.dumps(sorted(element.associated_names), ensure_ascii=False),
+        json.dumps(sorted(element.properties), ensure_ascii=False),
+        _dump_date(element.birth_date),
+        _dump_date(element.last_date),
+        None if element.extraction_origin is None else element.extraction_origin.name,
+    )
+
+
+def _record(row: Tuple) -> StoryElementRecord:
+    elem_id, element_type, name, associated_names, properties, birth_date, last_date, origin = row
+    return StoryElementRecord(
+        name=name,
+        type=element_type,
+        id=uuid.UUID(elem_id),
+        associated_names=set(json.loads(associated_names)),
+        properties=set(json.loads(properties)),
+        birth_date=_load_date(birth_date),
+        last_date=_load_date(last_date),
+        extraction_origin=None if origin is None else StoryElementExtractionOrigin[origin],
+    )
+
+
+def _dump_date(date: Optional[PartialDateTime]) -> Optional[str]:
+    if date is None:
+        return None
+    return json.dumps({
+        'year': date.year, 'month': date.month, 'day': date.day,
+        'hour': date.hour, 'minute': date.minute, 'second': date.second, 'microsecond': date.microsecond,
+        'relative_offset': (date.relative_offset or datetime.timedelta(0)).total_seconds(),
+        'weekday': date.weekday,
+    })
+
+
+def _load_date(data: Optional[str]) -> Optional[PartialDateTime]:
+    if data is None:
+        return None
+    fields = json.loads(data)
+    fields['relative_offset'] = datetime.timedelta(seconds=fields['relative_offset'])
+    return PartialDateTime(**fields)
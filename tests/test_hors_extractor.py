@@ -0,0 +1,90 @@
+import random
+import threading
+
+import pytest
+from hors import process_phrase
+from hors.dict import Morph
+from hors.hors_sugar import preprocess, preprocess_today
+from hors.partial_date.partial_datetime import PartialDateTime
+
+from preprocess.modules.extraction.date.extractors.hors import HorsDateExtractor
+from preprocess.modules.markup.models import EventMarkupBlock
+
+NOW = PartialDateTime(2020, 5, 1, 12, 0, 0, 0)
+
+PHRASES = [
+    'Он пришёл завтра в 5 часов вечера',
+    'Встретимся в понедельник утром',
+    'Через полчаса начнётся спектакль',
+    'Прошло 3 дня, и в обед она уехала',
+    '12 июня 1812 года армия перешла реку',
+    'вечерком зайду',
+    'в прошлом году мы жили в Москве',
+    'Гуров отрезал себе ломоть и стал есть не спеша',
+    'после обеда через 2 часа',
+    'с 5 по 7 мая',
+]
+
+
+def _key(d):
+    return str(d.type), str(d.date_from), str(d.date_to), str(d.span), d.has_time, d.start, d.end
+
+
+def _expected(phrase):
+    return [_key(d) for d in sorted(process_phrase(phrase, NOW).dates, key=lambda d: d.start)]
+
+
+def _actual(extractor, phrase):
+    _, dates = extractor.extract(phrase, EventMarkupBlock([]), NOW)
+    return [_key(d) for d in dates]
+
+
+@pytest.mark.parametrize('phrase', PHRASES)
+def test_matches_process_phrase(phrase):
+    assert _actual(HorsDateExtractor(), phrase) == _expected(phrase)
+
+
+def test_cached_result_matches_process_phrase():
+    extractor = HorsDateExtractor(cache_size=2)
+    for phrase in PHRASES + PHRASES:
+        assert _actual(extractor, phrase) == _expected(phrase)
+    assert len(extractor._cache) <= 2
+
+
+def test_prefilter_does_not_skip_dates():
+    rnd = random.Random(5)
+    vocab = list(Morph.storage) + ['в', 'на', 'и', 'до', 'через', 'назад', 'он', 'дом', 'пошёл', '5', '12', '2020']
+    for _ in range(500):
+        phrase = ' '.join(rnd.choice(vocab) for _ in range(rnd.randint(1, 6)))
+        try:
+            expected = process_phrase(phrase, NOW)
+        except Exception:
+            # hors падает на части случайных сочетаний; такие фразы не сравниваются
+            continue
+        prepared = preprocess(phrase)
+        if expected.dates:
+            assert HorsDateExtractor._has_trigger(prepared) or \
+                HorsDateExtractor._has_trigger(preprocess_today(prepared)), phrase
+
+
+def test_cache_is_thread_safe():
+    extractor = HorsDateExtractor(cache_size=3)
+    expected = {phrase: _expected(phrase) for phrase in PHRASES}
+    errors = []
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        try:
+            for _ in range(200):
+                phrase = rnd.choice(PHRASES)
+                assert _actual(extractor, phrase) == expected[phrase]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(extractor._cache) <= 3
@@ -0,0 +1,74 @@
+from preprocess.modules.extraction.properties.pipeline import PropertiesExtractionPipeline
+from preprocess.modules.markup.models import EventMarkup, EventToken
+from story_elements.database import StoryElementsDatabase
+from story_elements.models import Character
+
+
+def _markup(rows):
+    return EventMarkup([EventToken.create(i, head, rel, text, pos, None)
+                        for i, (head, rel, text, pos) in enumerate(rows, start=1)])
+
+
+def _assert_tree(em):
+    ids = [t.id for t in em.tokens]
+    heads = {t.id: t.head_id for t in em.tokens}
+    assert ids == list(range(1, len(ids) + 1))
+    assert all(head == 0 or head in heads for head in heads.values())
+    assert sum(head == 0 for head in heads.values()) == 1
+    for tok_id in ids:
+        seen = set()
+        while tok_id != 0:
+            assert tok_id not in seen
+            seen.add(tok_id)
+            tok_id = heads[tok_id]
+
+
+def _run(rows):
+    db = StoryElementsDatabase()
+    anna = Character(name='Анна')
+    db.characters.add(anna)
+    em = _markup(rows)
+    PropertiesExtractionPipeline(db).process(str(em), [em], {'PER': {1: anna.id}})
+    return em, db.characters.find_by_id(anna.id)
+
+
+def test_root_verb_is_kept():
+    em, anna = _run([
+        (2, 'amod', 'красивая', 'ADJ'),
+        (3, 'nsubj', '<|PER_1|>', 'PROPN'),
+        (0, 'root', 'пришла', 'VERB'),
+        (3, 'advmod', 'быстро', 'ADV'),
+        (3, 'punct', '.', 'PUNCT'),
+    ])
+    _assert_tree(em)
+    assert [t.text for t in em.tokens] == ['<|PER_1|>', 'пришла', '.']
+    assert {'красивая', 'пришла', 'быстро'} <= anna.properties
+
+
+def test_children_of_removed_tokens_are_repointed():
+    em, anna = _run([
+        (0, 'root', 'Он', 'PRON'),
+        (1, 'parataxis', 'сказал', 'VERB'),
+        (6, 'mark', 'что', 'SCONJ'),
+        (6, 'nsubj', '<|PER_1|>', 'PROPN'),
+        (6, 'advmod', 'вчера', 'ADV'),
+        (2, 'ccomp', 'ушла', 'VERB'),
+        (6, 'obl', 'домой', 'ADV'),
+    ])
+    _assert_tree(em)
+    texts = {t.id: t.text for t in em.tokens}
+    heads = {texts[t.id]: texts.get(t.head_id) for t in em.tokens}
+    assert 'ушла' not in heads and 'вчера' not in heads
+    # дети удалённого «ушла» переходят к «сказал»
+    assert heads['что'] == heads['<|PER_1|>'] == heads['домой'] == 'сказал'
+    assert {'ушла', 'вчера'} <= anna.properties
+
+
+def test_entity_placeholders_are_kept():
+    em, _ = _run([
+        (0, 'root', '<|PER_1|>', 'PROPN'),
+        (1, 'acl:relcl', 'любила', 'VERB'),
+        (2, 'obj', '<|PER_2|>', 'PROPN'),
+    ])
+    _assert_tree(em)
+    assert [t.text for t in em.tokens] == ['<|PER_1|>', '<|PER_2|>']
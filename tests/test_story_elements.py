@@ -0,0 +1,29 @@
+import pytest
+
+from story_elements.database import StoryElementsDatabase
+from story_elements.models import Character
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def database(request, tmp_path):
+    db = StoryElementsDatabase(None if request.param == 'memory' else str(tmp_path / 'elements.sqlite'))
+    yield db
+    db.close()
+
+
+def _names(db, names):
+    for name in names:
+        db.characters.add(Character(name=name))
+    return [e.name for e in db.characters.elements]
+
+
+def test_full_name_links_its_parts(database):
+    assert _names(database, ['Анна', 'Сергеевна', 'Анна Сергеевна']) == ['Анна']
+
+
+def test_shared_first_name_does_not_merge_full_names(database):
+    assert _names(database, ['Анна Сергеевна', 'Анна Павловна', 'Анна']) == ['Анна Сергеевна', 'Анна Павловна']
+
+
+def test_one_word_name_links_to_full_name(database):
+    assert _names(database, ['Анна', 'Анна Сергеевна', 'Анна Павловна', 'Павловна']) == ['Анна', 'Анна Павловна']